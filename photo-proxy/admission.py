@@ -0,0 +1,85 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+import asyncio
+import logging
+from timing import NULL_TIMER
+
+logger = logging.getLogger(__name__)
+
+class AdmissionRejectedError(Exception):
+    """Raised when a request can't be admitted because the wait queue is full."""
+
+class AdmissionController:
+    """
+    Concurrency limiter with a bounded wait queue.
+    Limits how many cache misses are downloaded and processed at the same time,
+    so a burst of misses can't starve the requests that are served from the cache.
+    """
+    def __init__(self, max_concurrent: int = 2, max_queue: int = 16, queue_timeout: Optional[float] = 30):
+        """
+        Initialize the controller.
+
+        Args:
+            max_concurrent: Maximum number of requests processed at the same time
+            max_queue: Maximum number of requests waiting for a slot
+            queue_timeout: Maximum number of seconds a request waits for a slot (None to wait forever)
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self, timer=NULL_TIMER) -> AsyncIterator[None]:
+        """
+        Wait for a processing slot and hold it for the duration of the context.
+
+        Args:
+            timer: RequestTimer measuring the time spent waiting in the queue
+
+        Raises:
+            AdmissionRejectedError: If the wait queue is full or the wait timed out
+        """
+        if self.active + self.waiting >= self.max_concurrent + self.max_queue:
+            self.rejected += 1
+            logger.warning(f"Rejected request, processing queue is full ({self.waiting} waiting)")
+            raise AdmissionRejectedError("Processing queue is full")
+
+        self.waiting += 1
+        try:
+            with timer.stage("queue"):
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            logger.warning(f"Rejected request after waiting {self.queue_timeout}s for a processing slot")
+            raise AdmissionRejectedError("Timed out waiting for a processing slot")
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Get admission statistics.
+
+        Returns:
+            Dictionary with admission statistics
+        """
+        return {
+            "active": self.active,
+            "max_concurrent": self.max_concurrent,
+            "waiting": self.waiting,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,160 @@
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(Exception):
+    """Raised when a call is refused because the circuit is open."""
+
+class CircuitBreaker:
+    """
+    Circuit breaker with exponential backoff.
+    After failure_threshold consecutive failures the circuit opens and calls fail fast.
+    Once the backoff has passed a single trial call is let through (half open);
+    on success the circuit closes, on failure it opens again with a doubled backoff.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 3,
+        base_backoff: float = 5,
+        max_backoff: float = 300,
+        ignore_exceptions: Tuple[Type[BaseException], ...] = ()
+    ):
+        """
+        Initialize the circuit breaker.
+
+        Args:
+            name: Name of the protected service (used for logging)
+            failure_threshold: Number of consecutive failures that open the circuit
+            base_backoff: Seconds the circuit stays open after it first opens
+            max_backoff: Upper limit for the backoff in seconds
+            ignore_exceptions: Exceptions that don't count as failures (e.g. not found)
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.ignore_exceptions = ignore_exceptions
+        self.state = self.CLOSED
+        self.failures = 0
+        self.open_count = 0
+        self.opened_until = 0.0
+        self.last_error: Optional[str] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def _allow_call(self) -> bool:
+        """
+        Check whether a call may be made and move from open to half open if the backoff passed.
+
+        Returns:
+            True if the call may be made
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.time() >= self.opened_until:
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                logger.info(f"Circuit for {self.name} is half open, trying a request")
+                return True
+            return False
+
+    def record_success(self) -> None:
+        """Record a successful call and close the circuit."""
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit for {self.name} closed, service recovered")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.open_count = 0
+            self._trial_running = False
+
+    def record_failure(self, error: BaseException) -> None:
+        """
+        Record a failed call and open the circuit if the threshold is reached.
+
+        Args:
+            error: Exception raised by the call
+        """
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error) or type(error).__name__
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                backoff = min(self.base_backoff * (2 ** self.open_count), self.max_backoff)
+                self.open_count += 1
+                self.state = self.OPEN
+                self.opened_until = time.time() + backoff
+                logger.warning(f"Circuit for {self.name} opened for {backoff:.0f}s after {self.failures} failures: {self.last_error}")
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Call a function through the circuit breaker.
+
+        Args:
+            func: Function to call
+            *args: Positional arguments for the function
+            **kwargs: Keyword arguments for the function
+
+        Returns:
+            Return value of the function
+
+        Raises:
+            CircuitOpenError: If the circuit is open
+        """
+        if not self._allow_call():
+            raise CircuitOpenError(f"{self.name} is unavailable, retrying in {self.retry_in():.0f}s")
+        try:
+            result = func(*args, **kwargs)
+        except self.ignore_exceptions:
+            self.record_success()
+            raise
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    def retry_in(self) -> float:
+        """
+        Get the number of seconds until the next trial call is allowed.
+
+        Returns:
+            Seconds until the circuit becomes half open (0 if calls are allowed)
+        """
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.opened_until - time.time())
+
+    def is_available(self) -> bool:
+        """
+        Check whether calls are currently let through.
+
+        Returns:
+            True unless the circuit is open and the backoff hasn't passed
+        """
+        return self.state == self.CLOSED or self.retry_in() == 0
+
+    def get_state(self) -> Dict:
+        """
+        Get the state of the circuit breaker.
+
+        Returns:
+            Dictionary with state, consecutive failures, retry delay and last error
+        """
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "retry_in": round(self.retry_in(), 1),
+            "last_error": self.last_error
+        }
@@ -0,0 +1,312 @@
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+# Before Python 3.13 every mapping keeps a duplicate of the file descriptor open
+MAPPING_KEEPS_FD = sys.version_info < (3, 13)
+MMAP_OPTIONS = {} if MAPPING_KEEPS_FD else {"trackfd": False}
+
+class DiskCache:
+    """
+    On-disk cache for processed images shared by all worker processes.
+    Image data is stored in one file per entry, the entries are tracked in SQLite
+    and evicted least recently used once the cache exceeds its size limit.
+    Entry files are never modified in place, only replaced or unlinked, so they can be
+    memory-mapped: a mapping stays valid after the entry is evicted.
+    File locks make sure an image is only processed by one process at a time.
+    """
+    # Only write access times back when they are older than this, so hits stay read-only
+    ACCESS_UPDATE_INTERVAL = 60
+    # Seconds invalidations are kept for other processes to pick up
+    INVALIDATION_RETENTION = 24 * 3600
+    # Number of hex digits of the key hash selecting the lock file, keys share 16^n lock files
+    LOCK_STRIPE_DIGITS = 2
+
+    def __init__(self, directory: str, max_size_mb: int = 500):
+        """
+        Initialize the cache and create its directories and database.
+
+        Args:
+            directory: Directory to store the cache in
+            max_size_mb: Maximum size of the cached images in megabytes
+        """
+        self.directory = directory
+        self.max_bytes = max_size_mb * 1024 * 1024
+        self.data_dir = os.path.join(directory, "images")
+        self.lock_dir = os.path.join(directory, "locks")
+        self.db_path = os.path.join(directory, "cache.db")
+        os.makedirs(self.data_dir, exist_ok=True)
+        os.makedirs(self.lock_dir, exist_ok=True)
+        self._remove_unused_locks()
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    file TEXT NOT NULL,
+                    content_type TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            # Invalidated path prefixes, so other processes can drop them from their memory caches
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS invalidations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    prefix TEXT NOT NULL,
+                    created REAL NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """
+        Open a connection to the cache database, committed and closed on exit.
+
+        Returns:
+            SQLite connection
+        """
+        db = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def _hash(key: str) -> str:
+        """
+        Get the file name for a cache key.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Hex digest of the key
+        """
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, mapped: bool = False) -> Optional[Tuple[Union[bytes, memoryview], str]]:
+        """
+        Get an image from the cache.
+
+        Args:
+            key: Cache key (typically the image path)
+            mapped: Memory-map the entry instead of reading it, the data is then backed
+                by the page cache shared by all processes instead of a private copy.
+                Before Python 3.13 the mapping holds an open file descriptor until it is released
+
+        Returns:
+            Tuple of (image_data, content_type) if found, None otherwise
+        """
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT file, content_type, last_access FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            file_name, content_type, last_access = row
+            try:
+                with open(os.path.join(self.data_dir, file_name), "rb") as f:
+                    if mapped:
+                        data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ, **MMAP_OPTIONS))
+                    else:
+                        data = f.read()
+            except FileNotFoundError:
+                # Evicted by another process in the meantime
+                db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            now = time.time()
+            if now - last_access > self.ACCESS_UPDATE_INTERVAL:
+                db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+        return data, content_type
+
+    def put(self, key: str, image_data: bytes, content_type: str) -> None:
+        """
+        Store an image in the cache and evict old entries if the cache is full.
+
+        Args:
+            key: Cache key (typically the image path)
+            image_data: Processed image data
+            content_type: Content type of the image
+        """
+        file_name = self._hash(key)
+        # Write to a temporary file first so other processes never read partial data
+        fd, tmp_path = tempfile.mkstemp(dir=self.data_dir, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(image_data)
+            os.replace(tmp_path, os.path.join(self.data_dir, file_name))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, file, content_type, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, file_name, content_type, len(image_data), time.time())
+            )
+        logger.debug(f"Added image to disk cache: {key}")
+        self._evict()
+
+    def _evict(self) -> None:
+        """Remove the least recently used entries until the cache fits its size limit."""
+        with self._connect() as db:
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            removed = 0
+            for key, file_name, size in db.execute(
+                "SELECT key, file, size FROM entries ORDER BY last_access"
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                try:
+                    os.unlink(os.path.join(self.data_dir, file_name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+        logger.debug(f"Evicted {removed} entries from disk cache")
+
+    def _remove_unused_locks(self) -> None:
+        """Remove lock files of earlier versions, which used one lock file per cache key."""
+        for file_name in os.listdir(self.lock_dir):
+            if len(file_name) != self.LOCK_STRIPE_DIGITS + len(".lock"):
+                try:
+                    os.unlink(os.path.join(self.lock_dir, file_name))
+                except FileNotFoundError:
+                    pass
+
+    @contextmanager
+    def lock(self, key: str) -> Iterator[None]:
+        """
+        Hold an exclusive lock for a cache key across threads and processes.
+        Used to make sure only one worker downloads and processes a given image.
+        Keys are spread over a fixed set of lock files, so the lock directory doesn't grow
+        with the cache. Keys sharing a lock file are processed one after the other.
+
+        Args:
+            key: Cache key (typically the image path)
+        """
+        lock_path = os.path.join(self.lock_dir, f"{self._hash(key)[:self.LOCK_STRIPE_DIGITS]}.lock")
+        with open(lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def invalidate(self, prefixes: List[str]) -> int:
+        """
+        Remove all images whose path starts with one of the prefixes and record the
+        invalidation for the memory caches of the other processes.
+        Keys of portrait pairs match the paths of both portraits.
+
+        Args:
+            prefixes: Path prefixes, e.g. the path of an image or a folder
+
+        Returns:
+            Number of removed entries
+        """
+        if not prefixes:
+            return 0
+        now = time.time()
+        removed = 0
+        with self._connect() as db:
+            for prefix in prefixes:
+                rows = db.execute(
+                    "SELECT key, file FROM entries WHERE substr(key, 1, ?) = ? OR instr(key, ?) > 0",
+                    (len(prefix), prefix, f"+{prefix}")
+                ).fetchall()
+                for key, file_name in rows:
+                    db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    try:
+                        os.unlink(os.path.join(self.data_dir, file_name))
+                    except FileNotFoundError:
+                        pass
+                removed += len(rows)
+            db.executemany(
+                "INSERT INTO invalidations (prefix, created) VALUES (?, ?)",
+                [(prefix, now) for prefix in prefixes]
+            )
+            db.execute("DELETE FROM invalidations WHERE created < ?", (now - self.INVALIDATION_RETENTION,))
+        logger.info(f"Invalidated {removed} entries of disk cache")
+        return removed
+
+    def get_invalidations(self, after_id: Optional[int] = None) -> Tuple[int, List[str]]:
+        """
+        Get the path prefixes invalidated since the last check.
+
+        Args:
+            after_id: Id of the last invalidation seen (None to only get the current id)
+
+        Returns:
+            Tuple of (id of the last invalidation, prefixes invalidated after after_id)
+        """
+        with self._connect() as db:
+            last_id = db.execute("SELECT COALESCE(MAX(id), 0) FROM invalidations").fetchone()[0]
+            if after_id is None or last_id <= after_id:
+                return last_id, []
+            rows = db.execute(
+                "SELECT prefix FROM invalidations WHERE id > ? AND id <= ? ORDER BY id", (after_id, last_id)
+            ).fetchall()
+        return last_id, [prefix for (prefix,) in rows]
+
+    def get_entries(self, limit: int = 1000) -> List[Dict]:
+        """
+        Get the cached images, most recently used first.
+
+        Args:
+            limit: Maximum number of entries to return
+
+        Returns:
+            List of dictionaries with key, content type, size in bytes and last access time
+        """
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT key, content_type, size, last_access FROM entries ORDER BY last_access DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [
+            {"key": key, "content_type": content_type, "size": size, "last_access": last_access}
+            for key, content_type, size, last_access in rows
+        ]
+
+    def clear(self) -> None:
+        """Clear the cache."""
+        with self._connect() as db:
+            for (file_name,) in db.execute("SELECT file FROM entries").fetchall():
+                try:
+                    os.unlink(os.path.join(self.data_dir, file_name))
+                except FileNotFoundError:
+                    pass
+            db.execute("DELETE FROM entries")
+        logger.info("Cleared disk cache")
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        Get cache statistics.
+
+        Returns:
+            Dictionary with number of entries and size in MB
+        """
+        with self._connect() as db:
+            count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {
+            "size": count,
+            "size_mb": round(total / (1024 * 1024), 2),
+            "max_size_mb": round(self.max_bytes / (1024 * 1024), 2)
+        }
@@ -0,0 +1,95 @@
+from io import BytesIO
+from typing import Dict, List, Tuple
+from PIL import Image
+import logging
+import piexif
+
+logger = logging.getLogger(__name__)
+
+# Number of bytes fetched from the start of a JPEG to find its previews.
+# The EXIF segment (with the thumbnail) is limited to 64 KB, the MPF index follows it.
+HEADER_BYTES = 128 * 1024
+
+# Previews larger than this are not worth fetching instead of the original
+MAX_PREVIEW_BYTES = 4 * 1024 * 1024
+
+# Long edge of MPF preview types with a defined size
+MP_TYPE_LONG_EDGES = {
+    "Large Thumbnail (VGA Equivalent)": 640,
+    "Large Thumbnail (Full HD Equivalent)": 1920
+}
+
+# Marker of the APP2 segment holding the MPF index
+MPF_MARKER = b"MPF\x00"
+
+def find_previews(header: bytes) -> Tuple[int, List[Dict]]:
+    """
+    Find the previews embedded in a JPEG: the EXIF thumbnail and the preview images
+    listed in the MPF index (used by many cameras for a VGA or Full HD preview).
+    Only the header is needed. The EXIF thumbnail is returned with its data, MPF previews
+    are stored after the main image and are returned with their position in the file.
+
+    Args:
+        header: First bytes of the JPEG (at least the EXIF and MPF segments)
+
+    Returns:
+        Tuple of (orientation of the main image, previews). Each preview is a dictionary with
+        either "data" or "offset" and "length", and "long_edge" if it is known before fetching
+    """
+    previews: List[Dict] = []
+    with Image.open(BytesIO(header)) as image:
+        if image.format not in ("JPEG", "MPO"):
+            return 1, []
+        exif_data = image.info.get("exif")
+        mpinfo = getattr(image, "mpinfo", None)
+
+    orientation = 1
+    if exif_data:
+        try:
+            exif_dict = piexif.load(exif_data)
+            orientation = exif_dict["0th"].get(piexif.ImageIFD.Orientation, 1)
+            if exif_dict.get("thumbnail"):
+                previews.append({"data": exif_dict["thumbnail"]})
+        except Exception as e:
+            logger.debug(f"Could not read EXIF thumbnail: {e}")
+
+    # MPF offsets are relative to the start of the MPF index, right after its marker
+    marker_position = header.find(MPF_MARKER)
+    if mpinfo and marker_position >= 0:
+        mp_offset = marker_position + len(MPF_MARKER)
+        for entry in mpinfo.get(0xB002, [])[1:]:
+            attribute = entry.get("Attribute", {})
+            if attribute.get("ImageDataFormat") != "JPEG" or not entry.get("DataOffset"):
+                continue
+            if entry["Size"] > MAX_PREVIEW_BYTES:
+                continue
+            previews.append({
+                "offset": mp_offset + entry["DataOffset"],
+                "length": entry["Size"],
+                "long_edge": MP_TYPE_LONG_EDGES.get(attribute.get("MPType"))
+            })
+
+    # Smallest first, the first preview that is large enough wins
+    previews.sort(key=lambda preview: len(preview["data"]) if "data" in preview else preview["length"])
+    return orientation, previews
+
+def get_preview_orientation(preview_data: bytes, default: int) -> int:
+    """
+    Get the orientation of a preview image.
+    MPF previews may carry their own EXIF data, EXIF thumbnails share the orientation of the main image.
+
+    Args:
+        preview_data: Preview JPEG data
+        default: Orientation of the main image
+
+    Returns:
+        EXIF orientation (1-8)
+    """
+    try:
+        with Image.open(BytesIO(preview_data)) as image:
+            exif = image.getexif()
+            if 0x0112 in exif:
+                return exif[0x0112]
+    except Exception:
+        pass
+    return default
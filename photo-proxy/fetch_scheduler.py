@@ -0,0 +1,267 @@
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Iterator, Optional
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Priority classes of the requests to Nextcloud
+INTERACTIVE = "interactive"  # A viewer is waiting for the image
+PREFETCH = "prefetch"        # Slides and cache warm-up, needed soon
+BACKGROUND = "background"    # Library scans and metadata crawl
+
+# Share of the fetch slots each class gets while all classes are waiting, highest priority first
+PRIORITY_WEIGHTS = {INTERACTIVE: 16, PREFETCH: 4, BACKGROUND: 1}
+
+_current_priority: ContextVar[str] = ContextVar("fetch_priority", default=INTERACTIVE)
+
+@contextmanager
+def fetch_priority(priority: str) -> Iterator[None]:
+    """
+    Set the priority class of the fetches made in this context. The priority is inherited
+    by worker threads started with asyncio.to_thread, so it doesn't have to be passed down.
+
+    Args:
+        priority: Priority class (INTERACTIVE, PREFETCH or BACKGROUND)
+    """
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+class TokenBucket:
+    """
+    Rate limit shared by threads, allowing bursts of one second.
+    Throttled consumers may go into debt, which delays the next throttled consumers.
+    Unthrottled consumers take tokens without waiting; the debt they leave is
+    limited to one second.
+    """
+    def __init__(self, rate: float):
+        """
+        Initialize the bucket, full.
+
+        Args:
+            rate: Tokens added per second
+        """
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        """Add the tokens accrued since the last update. Call with the lock held."""
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, amount: float, throttled: bool = True) -> float:
+        """
+        Take tokens from the bucket.
+
+        Args:
+            amount: Number of tokens to take
+            throttled: Whether the consumer is subject to the rate limit
+
+        Returns:
+            Seconds until the debt of the bucket is paid back (0 if unthrottled)
+        """
+        with self._lock:
+            self._refill()
+            if not throttled:
+                self.tokens = max(self.tokens - amount, -self.rate)
+                return 0.0
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def get_delay(self) -> float:
+        """
+        Get the time a throttled consumer has to wait before taking tokens.
+
+        Returns:
+            Seconds until the debt of the bucket is paid back
+        """
+        with self._lock:
+            self._refill()
+            return max(0.0, -self.tokens / self.rate)
+
+class Transfer:
+    """A fetch holding a slot of the scheduler. Counts the transferred bytes against the bandwidth cap."""
+    def __init__(self, scheduler: "FetchScheduler", priority: str):
+        """
+        Initialize the transfer.
+
+        Args:
+            scheduler: Scheduler the slot belongs to
+            priority: Priority class of the fetch
+        """
+        self.scheduler = scheduler
+        self.priority = priority
+        self.bytes = 0
+
+    def add_bytes(self, size: int) -> None:
+        """
+        Record received data. Never waits: bandwidth used beyond the cap by a throttled
+        class delays its next fetches before they take a slot.
+
+        Args:
+            size: Number of bytes received
+        """
+        self.bytes += size
+        bandwidth = self.scheduler._bandwidth
+        if bandwidth:
+            bandwidth.consume(size, throttled=self.priority != INTERACTIVE)
+
+class FetchScheduler:
+    """
+    Coordinates the requests of one process to Nextcloud.
+    At most max_concurrent fetches run at the same time. Free slots go to the waiting fetches
+    by weighted fair queueing between the priority classes (stride scheduling): interactive
+    fetches get most slots, while prefetching and scans still make progress. Fetches of the
+    same class are served in order.
+    The bandwidth and request rate caps are shared by all classes. Interactive fetches are
+    never delayed by them, but use up the budget of the other classes. Throttled fetches wait
+    for the caps before taking a slot, so a throttled fetch never holds a slot while it waits.
+    """
+    def __init__(self, max_concurrent: int = 4, max_bytes_per_second: float = 0, max_requests_per_second: float = 0):
+        """
+        Initialize the scheduler.
+
+        Args:
+            max_concurrent: Maximum number of fetches running at the same time
+            max_bytes_per_second: Bandwidth cap for prefetching and scans (0 for no cap)
+            max_requests_per_second: Request rate cap for prefetching and scans (0 for no cap)
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_bytes_per_second = max_bytes_per_second
+        self.max_requests_per_second = max_requests_per_second
+        self._bandwidth = TokenBucket(max_bytes_per_second) if max_bytes_per_second > 0 else None
+        self._requests = TokenBucket(max_requests_per_second) if max_requests_per_second > 0 else None
+        self._condition = threading.Condition()
+        self._queues: Dict[str, Deque[object]] = {priority: deque() for priority in PRIORITY_WEIGHTS}
+        # Virtual time at which each class is served next, and of the last served fetch
+        self._pass: Dict[str, float] = {priority: 0.0 for priority in PRIORITY_WEIGHTS}
+        self._virtual_time = 0.0
+        self._active = 0
+        self._stats: Dict[str, Dict[str, float]] = {
+            priority: {"requests": 0, "active": 0, "bytes": 0, "wait": 0.0, "max_wait": 0.0, "time": 0.0}
+            for priority in PRIORITY_WEIGHTS
+        }
+
+    def _next_ticket(self) -> Optional[object]:
+        """
+        Get the waiting fetch that is served next. Call with the condition held.
+
+        Returns:
+            Ticket of the fetch, None if no fetch is waiting
+        """
+        waiting = [priority for priority, queue in self._queues.items() if queue]
+        if not waiting:
+            return None
+        # Lowest virtual time wins, ties go to the higher priority
+        priority = min(waiting, key=lambda priority: self._pass[priority])
+        return self._queues[priority][0]
+
+    def _acquire(self, priority: str) -> None:
+        """
+        Wait for a free slot.
+
+        Args:
+            priority: Priority class of the fetch
+        """
+        ticket = object()
+        with self._condition:
+            queue = self._queues[priority]
+            if not queue:
+                # A class that was idle doesn't get credit for the time it didn't use
+                self._pass[priority] = max(self._pass[priority], self._virtual_time)
+            queue.append(ticket)
+            while self._active >= self.max_concurrent or self._next_ticket() is not ticket:
+                self._condition.wait()
+            queue.popleft()
+            self._virtual_time = self._pass[priority]
+            self._pass[priority] += 1 / PRIORITY_WEIGHTS[priority]
+            self._active += 1
+            self._stats[priority]["active"] += 1
+            # The next fetch in line may get a slot as well
+            self._condition.notify_all()
+
+    def _release(self, priority: str, wait: float, duration: float, size: int) -> None:
+        """
+        Free a slot and record the fetch.
+
+        Args:
+            priority: Priority class of the fetch
+            wait: Seconds the fetch waited for its slot
+            duration: Seconds the fetch held its slot
+            size: Number of bytes received
+        """
+        with self._condition:
+            self._active -= 1
+            stats = self._stats[priority]
+            stats["active"] -= 1
+            stats["requests"] += 1
+            stats["bytes"] += size
+            stats["wait"] += wait
+            stats["max_wait"] = max(stats["max_wait"], wait)
+            stats["time"] += duration
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, priority: Optional[str] = None) -> Iterator[Transfer]:
+        """
+        Wait for a fetch slot and hold it for the duration of the context. Blocking.
+
+        Args:
+            priority: Priority class of the fetch (None for the priority of the current context)
+
+        Returns:
+            Transfer to record the received bytes with
+        """
+        priority = priority or _current_priority.get()
+        if priority not in PRIORITY_WEIGHTS:
+            raise ValueError(f"Invalid fetch priority: {priority}")
+
+        start = time.perf_counter()
+        throttled = priority != INTERACTIVE
+        delay = self._requests.consume(1, throttled) if self._requests else 0.0
+        if throttled and self._bandwidth:
+            # Pay back the bandwidth used beyond the cap by earlier fetches
+            delay = max(delay, self._bandwidth.get_delay())
+        if delay:
+            time.sleep(delay)
+        self._acquire(priority)
+        acquired = time.perf_counter()
+        transfer = Transfer(self, priority)
+        try:
+            yield transfer
+        finally:
+            self._release(priority, acquired - start, time.perf_counter() - acquired, transfer.bytes)
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Get latency and throughput per priority class.
+
+        Returns:
+            Dictionary of priority class to statistics: completed requests, active and queued
+            fetches, average and maximum wait for a slot, average fetch time, bytes received
+            and throughput while fetching (KB/s)
+        """
+        with self._condition:
+            result = {}
+            for priority, stats in self._stats.items():
+                requests = stats["requests"]
+                result[priority] = {
+                    "requests": requests,
+                    "active": stats["active"],
+                    "queued": len(self._queues[priority]),
+                    "avg_wait_ms": round(stats["wait"] / requests * 1000, 1) if requests else 0,
+                    "max_wait_ms": round(stats["max_wait"] * 1000, 1),
+                    "avg_time_ms": round(stats["time"] / requests * 1000, 1) if requests else 0,
+                    "bytes": stats["bytes"],
+                    "throughput_kbps": round(stats["bytes"] / stats["time"] / 1024, 1) if stats["time"] else 0
+                }
+            return result
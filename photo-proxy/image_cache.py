@@ -1,5 +1,6 @@
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 import logging
+import random
 from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
@@ -8,6 +9,7 @@ class ImageCache:
     """
     LRU cache for storing processed images.
     Uses OrderedDict to maintain access order and limit size.
+    Images are either bytes or memoryviews of memory-mapped disk cache entries.
     """
     def __init__(self, max_size: int = 500):
         """
@@ -17,7 +19,7 @@ class ImageCache:
             max_size: Maximum number of images to store in the cache
         """
         self.max_size = max_size
-        self.cache: OrderedDict[str, Tuple[bytes, str]] = OrderedDict()
+        self.cache: OrderedDict[str, Tuple[Union[bytes, memoryview], str]] = OrderedDict()
         self.hits = 0
         self.misses = 0
 
@@ -39,7 +41,30 @@ class ImageCache:
         self.misses += 1
         return None
 
-    def put(self, key: str, image_data: bytes, content_type: str) -> None:
+    def peek(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """
+        Get an image from the cache without updating the access order or statistics.
+
+        Args:
+            key: Cache key (typically the image path)
+
+        Returns:
+            Tuple of (image_data, content_type) if found, None otherwise
+        """
+        return self.cache.get(key)
+
+    def get_random(self) -> Optional[Tuple[bytes, str]]:
+        """
+        Get a random image from the cache without updating statistics.
+
+        Returns:
+            Tuple of (image_data, content_type) if the cache is not empty, None otherwise
+        """
+        if not self.cache:
+            return None
+        return self.cache[random.choice(list(self.cache.keys()))]
+
+    def put(self, key: str, image_data: Union[bytes, memoryview], content_type: str) -> None:
         """
         Store an image in the cache.
 
@@ -60,6 +85,50 @@ class ImageCache:
         self.cache[key] = (image_data, content_type)
         logger.debug(f"Added image to cache: {key} (Cache size: {len(self.cache)})")
 
+    @staticmethod
+    def matches_prefix(key: str, prefixes: List[str]) -> bool:
+        """
+        Check whether a cache key belongs to an image path starting with one of the prefixes.
+        Keys of portrait pairs match the paths of both portraits.
+
+        Args:
+            key: Cache key (image path, optionally followed by "+" and the path of the partner)
+            prefixes: Path prefixes
+
+        Returns:
+            True if the key matches one of the prefixes
+        """
+        return any(key.startswith(prefix) or f"+{prefix}" in key for prefix in prefixes)
+
+    def invalidate(self, prefixes: List[str]) -> int:
+        """
+        Remove all images whose path starts with one of the prefixes.
+
+        Args:
+            prefixes: Path prefixes, e.g. the path of an image or a folder
+
+        Returns:
+            Number of removed entries
+        """
+        keys = [key for key in self.cache if self.matches_prefix(key, prefixes)]
+        for key in keys:
+            del self.cache[key]
+        if keys:
+            logger.info(f"Invalidated {len(keys)} entries of image cache")
+        return len(keys)
+
+    def get_entries(self) -> List[Dict]:
+        """
+        Get the cached images, most recently used first.
+
+        Returns:
+            List of dictionaries with key, content type and size in bytes
+        """
+        return [
+            {"key": key, "content_type": content_type, "size": len(data)}
+            for key, (data, content_type) in reversed(self.cache.items())
+        ]
+
     def clear(self) -> None:
         """Clear the cache."""
         self.cache.clear()
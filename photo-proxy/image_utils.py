@@ -1,40 +1,248 @@
 from io import BytesIO
 from PIL import Image
-import piexif
 import logging
-from typing import Optional, Tuple
+import math
+from typing import Dict, List, Optional, Tuple
+from timing import NULL_TIMER
+import jpeg_lossless
 
 logger = logging.getLogger(__name__)
 
+# HEIC/HEIF and AVIF support is optional, pillow-heif isn't available on all platforms
+try:
+    import pillow_heif
+    # Embedded thumbnails and depth maps aren't used, skip reading them
+    pillow_heif.register_heif_opener(thumbnails=False, depth_images=False)
+    pillow_heif.register_avif_opener(thumbnails=False, depth_images=False)
+    HEIF_SUPPORT = True
+except ImportError:
+    HEIF_SUPPORT = False
+
+# EXIF tag holding the orientation of the image
+ORIENTATION_TAG = 0x0112
+
+# Formats browsers can't display reliably, always converted to JPG
+TRANSCODED_FORMATS = ("heif", "avif")
+
+# Magic numbers at the start of GIF files
+GIF_SIGNATURES = (b"GIF87a", b"GIF89a")
+
+# Frame duration in milliseconds used when a GIF doesn't specify one
+DEFAULT_FRAME_DURATION = 100
+
+# Transposes that turn an image with the given EXIF orientation upright
+ORIENTATION_TRANSPOSES = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90
+}
+
+# Images with less detail than this don't get a perceptual hash: their hash is mostly noise
+# or a plain gradient (e.g. sky, night shots) and would match unrelated pictures.
+# Minimum standard deviation of the brightness of the hash thumbnail (0-255)
+MIN_PHASH_CONTRAST = 8.0
+# Minimum number of set and of cleared bits of the hash
+MIN_PHASH_BITS = 8
+
+# Color transparent areas get when an image is saved as JPEG, matching the letterbox bars
+JPEG_BACKGROUND = (0, 0, 0)
+
+# Where to place the crop window when cutting the top and bottom of an image
+# (0 = keep the top, 0.5 = center). Subjects of portraits are usually in the upper part.
+VERTICAL_CROP_BIAS = 0.33
+
 def handle_exif_rotation(image: Image.Image) -> Image.Image:
     """
     Handle EXIF rotation data in the image.
+    All eight orientations are handled, including the mirrored ones, so the result
+    has the size reported by get_display_size.
+
+    Args:
+        image: PIL Image object
+
+    Returns:
+        Upright PIL Image object if EXIF data indicates rotation or mirroring needed
+    """
+    orientation = get_orientation(image)
+    if orientation in ORIENTATION_TRANSPOSES:
+        image = image.transpose(ORIENTATION_TRANSPOSES[orientation])
+        logger.debug(f"Transposed image with EXIF orientation {orientation}")
+    return image
+
+def get_orientation(image: Image.Image) -> int:
+    """
+    Get the EXIF orientation of an image without decoding it.
 
     Args:
         image: PIL Image object
 
     Returns:
-        Rotated PIL Image object if EXIF data indicates rotation needed
+        EXIF orientation (1-8), 1 if the image has no orientation
     """
     try:
-        # Extract EXIF data
-        exif_dict = piexif.load(image.info.get("exif", b""))
-        if exif_dict and "0th" in exif_dict:
-            orientation = exif_dict["0th"].get(piexif.ImageIFD.Orientation)
-            if orientation:
-                # Rotate image based on EXIF orientation
-                rotation_angles = {
-                    3: 180,
-                    6: 270,
-                    8: 90
-                }
-                if orientation in rotation_angles:
-                    image = image.rotate(rotation_angles[orientation], expand=True)
-                    logger.debug(f"Rotated image by {rotation_angles[orientation]} degrees based on EXIF data")
+        return image.getexif().get(ORIENTATION_TAG, 1)
+    except Exception:
+        return 1
+
+def get_display_size(image: Image.Image) -> Tuple[int, int]:
+    """
+    Get the size of an image as displayed, i.e. after EXIF rotation.
+
+    Args:
+        image: PIL Image object
+
+    Returns:
+        Tuple of (width, height)
+    """
+    width, height = image.size
+    if get_orientation(image) in (5, 6, 7, 8):
+        return height, width
+    return width, height
+
+def read_image_info(image_data: bytes) -> Optional[Dict]:
+    """
+    Read format, displayed size and orientation from the image header without decoding it.
+    Works on the first part of a file as long as it contains the complete header.
+
+    Args:
+        image_data: Raw image data (or the beginning of it) in bytes
+
+    Returns:
+        Dictionary with format, width, height and orientation, None if the header can't be parsed
+    """
+    try:
+        with Image.open(BytesIO(image_data)) as image:
+            width, height = get_display_size(image)
+            return {
+                "format": image.format.lower(),
+                "width": width,
+                "height": height,
+                "orientation": get_orientation(image)
+            }
     except Exception as e:
-        logger.warning(f"Failed to process EXIF data: {e}")
+        logger.debug(f"Could not read image header: {e}")
+        return None
 
-    return image
+def compute_phash(image_data: bytes) -> Optional[str]:
+    """
+    Compute a perceptual hash (dHash) of an upright image: one bit per pixel of a 9x8
+    grayscale thumbnail, set if the pixel is brighter than its right neighbour.
+    Copies of a picture that were scaled or re-encoded get the same hash.
+    Images with too little detail get no hash, see MIN_PHASH_CONTRAST and MIN_PHASH_BITS.
+    JPEGs are decoded at a reduced resolution, so this is cheap for processed images.
+
+    Args:
+        image_data: Image data in bytes
+
+    Returns:
+        Hash as 16 hex digits, None if the image can't be decoded or has no detail
+    """
+    try:
+        with Image.open(BytesIO(image_data)) as image:
+            image.draft("L", (64, 64))
+            thumbnail = image.convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+            pixels = list(thumbnail.getdata())
+    except Exception as e:
+        logger.debug(f"Could not compute perceptual hash: {e}")
+        return None
+
+    mean = sum(pixels) / len(pixels)
+    if math.sqrt(sum((pixel - mean) ** 2 for pixel in pixels) / len(pixels)) < MIN_PHASH_CONTRAST:
+        return None
+    bits = 0
+    for row in range(8):
+        for column in range(8):
+            bits = bits << 1 | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    if not MIN_PHASH_BITS <= bin(bits).count("1") <= 64 - MIN_PHASH_BITS:
+        return None
+    return f"{bits:016x}"
+
+def is_gif(image_data: bytes) -> bool:
+    """
+    Check whether image data is a GIF from its signature.
+
+    Args:
+        image_data: Raw image data (or the beginning of it) in bytes
+
+    Returns:
+        True if the data starts with a GIF signature
+    """
+    return image_data[:6] in GIF_SIGNATURES
+
+def compute_crop_box(width: int, height: int, target_aspect: float) -> Tuple[float, float, float, float]:
+    """
+    Compute the crop window that fills the target aspect ratio.
+    Wide images are cropped at the center, tall images slightly above the center.
+    The box is relative (0-1), so it can be computed from the header and applied
+    to a downscaled decode.
+
+    Args:
+        width: Displayed width of the image
+        height: Displayed height of the image
+        target_aspect: Target width / height ratio
+
+    Returns:
+        Relative crop box (left, top, right, bottom)
+    """
+    aspect = width / height
+    if abs(aspect - target_aspect) / target_aspect < 0.01:
+        return (0.0, 0.0, 1.0, 1.0)
+    if aspect > target_aspect:
+        # Too wide, cut left and right
+        crop_width = target_aspect / aspect
+        left = (1 - crop_width) / 2
+        return (left, 0.0, left + crop_width, 1.0)
+    # Too tall, cut top and bottom
+    crop_height = aspect / target_aspect
+    top = (1 - crop_height) * VERTICAL_CROP_BIAS
+    return (0.0, top, 1.0, top + crop_height)
+
+def crop_relative(image: Image.Image, crop_box: Tuple[float, float, float, float]) -> Image.Image:
+    """
+    Crop an image with a relative crop box.
+
+    Args:
+        image: PIL Image object
+        crop_box: Relative crop box (left, top, right, bottom)
+
+    Returns:
+        Cropped PIL Image object
+    """
+    if crop_box == (0.0, 0.0, 1.0, 1.0):
+        return image
+    width, height = image.size
+    left, top, right, bottom = crop_box
+    box = (round(left * width), round(top * height), round(right * width), round(bottom * height))
+    logger.debug(f"Cropped image from {width}x{height} to {box[2] - box[0]}x{box[3] - box[1]}")
+    return image.crop(box)
+
+def apply_draft(image: Image.Image, max_size: int, crop_box: Optional[Tuple[float, float, float, float]] = None) -> None:
+    """
+    Let the JPEG decoder downscale while decoding (by 1/2, 1/4 or 1/8) if the
+    region needed for the output is at least twice as large as the output.
+    Must be called before the image is loaded. No-op for other formats.
+
+    Args:
+        image: PIL Image object that is not loaded yet
+        max_size: Maximum width/height of the output
+        crop_box: Relative crop box that will be applied after decoding
+    """
+    if image.format != "JPEG":
+        return
+    width, height = get_display_size(image)
+    left, top, right, bottom = crop_box or (0.0, 0.0, 1.0, 1.0)
+    region_long_edge = max(width * (right - left), height * (bottom - top))
+    factor = region_long_edge / max_size
+    if factor < 2:
+        return
+    stored_width, stored_height = image.size
+    requested = (math.ceil(stored_width / factor), math.ceil(stored_height / factor))
+    image.draft(image.mode, requested)
+    logger.debug(f"Decoding image at {image.size[0]}x{image.size[1]} instead of {stored_width}x{stored_height}")
 
 def crop_portrait_to_square(image: Image.Image) -> Image.Image:
     """
@@ -97,58 +305,203 @@ def convert_to_landscape_3_2(image: Image.Image) -> Image.Image:
 
 def convert_to_jpeg(image: Image.Image, quality: int = 85) -> Image.Image:
     """
-    Convert an image to JPEG format if needed.
+    Convert an image to a mode that can be saved as JPEG.
+    Transparent images (e.g. WebP, HEIF or AVIF with alpha) are flattened onto
+    JPEG_BACKGROUND, since JPEG has no alpha channel.
 
     Args:
         image: PIL Image object
         quality: JPEG quality (1-100)
 
     Returns:
-        Converted PIL Image object
+        Converted PIL Image object in RGB mode
     """
-    if image.mode not in ('RGB', 'RGBA'):
-        image = image.convert('RGB')
+    if image.mode == "P" and "transparency" in image.info:
+        image = image.convert("RGBA")
+    if image.mode in ("RGBA", "LA", "PA", "RGBa", "La"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, JPEG_BACKGROUND)
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    if image.mode != "RGB":
+        image = image.convert("RGB")
     return image
 
-def process_image(
+def prepare_image(
     image_data: bytes,
     max_size: Optional[int] = None,
-    quality: int = 85,
-    convert_to_jpg: bool = True,
-    crop_portrait_to_square: bool = False
-) -> bytes:
+    crop_portrait_to_square: bool = False,
+    target_aspect: Optional[float] = None,
+    allow_upscale: bool = False,
+    timer=NULL_TIMER
+) -> Tuple[Image.Image, str]:
     """
-    Process an image by scaling, rotating based on EXIF, and optionally converting to JPG.
+    Decode, rotate, crop and scale an image.
+    The crop geometry is computed from the header before decoding, so JPEGs are
+    decoded at the lowest resolution that still covers the output.
 
     Args:
         image_data: Raw image data in bytes
         max_size: Maximum width/height for scaling (None for no scaling)
-        quality: JPEG quality (1-100)
-        convert_to_jpg: Whether to convert the image to JPG format
-        crop_portrait_to_square: Whether to crop portrait images to 3:2 landscape format
+        crop_portrait_to_square: Whether to convert portrait images to 3:2 landscape format
+        target_aspect: Width / height ratio to crop the image to (None to keep the aspect ratio)
+        allow_upscale: Whether to enlarge images that are smaller than max_size
+        timer: RequestTimer collecting the duration of each processing stage
 
     Returns:
-        Processed image data in bytes
+        Tuple of (PIL Image object, original format)
     """
-    try:
-        # Open image from bytes
+    # Open and decode image from bytes
+    with timer.stage("decode"):
         image = Image.open(BytesIO(image_data))
 
         # Get original format
         original_format = image.format.lower()
 
-        # Handle EXIF rotation
+        crop_box = compute_crop_box(*get_display_size(image), target_aspect) if target_aspect else None
+        if max_size:
+            apply_draft(image, max_size, crop_box)
+        image.load()
+
+    # Handle EXIF rotation
+    with timer.stage("exif"):
         image = handle_exif_rotation(image)
 
-        # Scale image if max_size is specified
-        if max_size:
-            image = scale_image(image, max_size)
+    # Crop to the target aspect ratio before scaling, so fewer pixels are resampled
+    if crop_box:
+        with timer.stage("crop"):
+            image = crop_relative(image, crop_box)
+
+    # Scale image if max_size is specified
+    if max_size:
+        with timer.stage("resize"):
+            image = scale_image(image, max_size, allow_upscale)
 
-        # Convert portrait images to 3:2 landscape if requested
-        if crop_portrait_to_square:
+    # Convert portrait images to 3:2 landscape if requested
+    if crop_portrait_to_square and not target_aspect:
+        with timer.stage("crop"):
             image = convert_to_landscape_3_2(image)
 
-        # Convert to JPEG if requested
+    return image, original_format
+
+def can_pass_through(
+    image_data: bytes,
+    max_size: Optional[int] = None,
+    convert_to_jpg: bool = True,
+    crop_portrait_to_square: bool = False,
+    target_aspect: Optional[float] = None,
+    allow_upscale: bool = False
+) -> bool:
+    """
+    Check whether an image already matches the requested output, so the original
+    bytes can be served without decoding and re-encoding it.
+
+    Args:
+        image_data: Raw image data in bytes
+        max_size: Maximum width/height of the output (None for no scaling)
+        convert_to_jpg: Whether the output must be a JPG
+        crop_portrait_to_square: Whether portrait images are converted to 3:2 landscape
+        target_aspect: Width / height ratio the output is cropped to
+        allow_upscale: Whether images smaller than max_size are enlarged
+
+    Returns:
+        True if the original image can be served as is
+    """
+    try:
+        with Image.open(BytesIO(image_data)) as image:
+            width, height = image.size
+            if target_aspect and abs(width / height - target_aspect) / target_aspect >= 0.01:
+                return False
+            if crop_portrait_to_square and not target_aspect and height > width:
+                return False
+            if max_size and (max(width, height) > max_size or (allow_upscale and max(width, height) < max_size)):
+                return False
+            if get_orientation(image) != 1:
+                return False
+            if convert_to_jpg and (image.format != "JPEG" or image.mode not in ("RGB", "L")):
+                return False
+            if image.format.lower() in TRANSCODED_FORMATS:
+                return False
+            if image.format == "GIF":
+                # May be animated or cut off after the download budget, only the first frame is served
+                return False
+            return True
+    except Exception as e:
+        logger.debug(f"Could not check image for passthrough: {e}")
+        return False
+
+def transform_losslessly(
+    image_data: bytes,
+    max_size: Optional[int] = None,
+    crop_portrait_to_square: bool = False,
+    target_aspect: Optional[float] = None,
+    allow_upscale: bool = False
+) -> Optional[bytes]:
+    """
+    Apply EXIF rotation and aspect crop to a JPEG in the DCT domain if no scaling is needed.
+    Avoids the decode / re-encode cycle and the quality loss that comes with it.
+
+    Args:
+        image_data: Raw image data in bytes
+        max_size: Maximum width/height of the output (None for no scaling)
+        crop_portrait_to_square: Whether portrait images are converted to 3:2 landscape
+        target_aspect: Width / height ratio the output is cropped to
+        allow_upscale: Whether images smaller than max_size are enlarged
+
+    Returns:
+        Transformed JPG image data in bytes, None if the image needs the pixel path
+    """
+    if not jpeg_lossless.is_available():
+        return None
+    try:
+        with Image.open(BytesIO(image_data)) as image:
+            if image.format != "JPEG" or image.mode not in ("RGB", "L"):
+                return None
+            width, height = get_display_size(image)
+            orientation = get_orientation(image)
+    except Exception as e:
+        logger.debug(f"Could not check image for lossless transform: {e}")
+        return None
+
+    long_edge = max(width, height)
+    if max_size and (long_edge > max_size or (allow_upscale and long_edge < max_size)):
+        return None
+    if crop_portrait_to_square and not target_aspect and height > width:
+        # Needs black bars, which can't be added without re-encoding
+        return None
+    crop_box = compute_crop_box(width, height, target_aspect) if target_aspect else None
+    if orientation == 1 and not crop_box:
+        return None
+
+    try:
+        return jpeg_lossless.transform(image_data, orientation, crop_box)
+    except jpeg_lossless.LosslessTransformError as e:
+        logger.debug(f"Falling back to decoding the image: {e}")
+        return None
+
+def encode_image(
+    image: Image.Image,
+    original_format: str,
+    quality: int = 85,
+    convert_to_jpg: bool = True,
+    timer=NULL_TIMER
+) -> bytes:
+    """
+    Encode an image as JPG or in its original format.
+
+    Args:
+        image: PIL Image object
+        original_format: Format of the source image
+        quality: JPEG quality (1-100)
+        convert_to_jpg: Whether to convert the image to JPG format
+        timer: RequestTimer collecting the duration of each processing stage
+
+    Returns:
+        Encoded image data in bytes
+    """
+    with timer.stage("encode"):
+        # Convert to JPEG if requested or if browsers can't display the original format
+        convert_to_jpg = convert_to_jpg or original_format in TRANSCODED_FORMATS
         if convert_to_jpg:
             image = convert_to_jpeg(image, quality)
 
@@ -163,19 +516,280 @@ def process_image(
             # Save in original format
             image.save(output, format=original_format)
 
-        return output.getvalue()
+    return output.getvalue()
+
+def process_animation(
+    image_data: bytes,
+    max_size: Optional[int] = None,
+    quality: int = 85,
+    target_aspect: Optional[float] = None,
+    allow_upscale: bool = False,
+    max_frames: int = 100,
+    max_output_bytes: Optional[int] = None,
+    timer=NULL_TIMER
+) -> bytes:
+    """
+    Convert an animated GIF into a scaled animated WebP.
+    At most max_frames frames are decoded, frames missing from a truncated download
+    are dropped. If the animation exceeds max_output_bytes, only the first frame is kept.
+
+    Args:
+        image_data: Raw GIF data in bytes (may be cut off)
+        max_size: Maximum width/height for scaling (None for no scaling)
+        quality: WebP quality (1-100)
+        target_aspect: Width / height ratio to crop the frames to (None to keep the aspect ratio)
+        allow_upscale: Whether to enlarge images that are smaller than max_size
+        max_frames: Maximum number of frames in the output
+        max_output_bytes: Maximum size of the animation (None for no limit)
+        timer: RequestTimer collecting the duration of each processing stage
+
+    Returns:
+        WebP image data in bytes
+    """
+    frames: List[Image.Image] = []
+    durations: List[int] = []
+    with Image.open(BytesIO(image_data)) as image:
+        loop = image.info.get("loop", 0)
+        crop_box = compute_crop_box(*image.size, target_aspect) if target_aspect else None
+        for index in range(max_frames):
+            with timer.stage("decode"):
+                try:
+                    image.seek(index)
+                    frame = image.convert("RGBA")
+                except EOFError:
+                    break
+                except OSError as e:
+                    if not frames:
+                        raise
+                    logger.debug(f"Stopping at frame {index} of truncated animation: {e}")
+                    break
+            if crop_box:
+                with timer.stage("crop"):
+                    frame = crop_relative(frame, crop_box)
+            if max_size:
+                with timer.stage("resize"):
+                    frame = scale_image(frame, max_size, allow_upscale)
+            frames.append(frame)
+            durations.append(image.info.get("duration") or DEFAULT_FRAME_DURATION)
+
+    with timer.stage("encode"):
+        output = BytesIO()
+        frames[0].save(
+            output,
+            format="WEBP",
+            save_all=len(frames) > 1,
+            append_images=frames[1:],
+            duration=durations,
+            loop=loop,
+            quality=quality
+        )
+        if max_output_bytes and output.tell() > max_output_bytes:
+            logger.info(f"Animation with {len(frames)} frames exceeds {max_output_bytes} bytes, keeping the first frame")
+            output = BytesIO()
+            frames[0].save(output, format="WEBP", quality=quality)
+    logger.debug(f"Converted animation with {len(frames)} frames to WebP")
+    return output.getvalue()
+
+def process_embedded_preview(
+    preview_data: bytes,
+    orientation: int,
+    size: int,
+    quality: int = 85,
+    crop_portrait_to_square: bool = False,
+    target_aspect: Optional[float] = None,
+    timer=NULL_TIMER
+) -> Optional[bytes]:
+    """
+    Create the output from a preview embedded in a JPEG instead of the full image.
+    Previews don't carry the orientation of the main image, so it is passed in.
+
+    Args:
+        preview_data: Preview JPEG data
+        orientation: EXIF orientation to apply to the preview
+        size: Maximum width/height of the output
+        quality: JPEG quality (1-100)
+        crop_portrait_to_square: Whether to convert portrait images to 3:2 landscape format
+        target_aspect: Width / height ratio to crop the image to (None to keep the aspect ratio)
+        timer: RequestTimer collecting the duration of each processing stage
+
+    Returns:
+        Processed JPG image data in bytes, None if the preview is too small for the output
+    """
+    with timer.stage("decode"):
+        image = Image.open(BytesIO(preview_data))
+        width, height = image.size
+        if orientation in (5, 6, 7, 8):
+            width, height = height, width
+        crop_box = compute_crop_box(width, height, target_aspect) if target_aspect else None
+        left, top, right, bottom = crop_box or (0.0, 0.0, 1.0, 1.0)
+        if max(width * (right - left), height * (bottom - top)) < size:
+            return None
+        image.load()
+
+    with timer.stage("exif"):
+        if orientation in ORIENTATION_TRANSPOSES:
+            image = image.transpose(ORIENTATION_TRANSPOSES[orientation])
+
+    if crop_box:
+        with timer.stage("crop"):
+            image = crop_relative(image, crop_box)
+
+    with timer.stage("resize"):
+        image = scale_image(image, size)
+
+    if crop_portrait_to_square and not target_aspect:
+        with timer.stage("crop"):
+            image = convert_to_landscape_3_2(image)
+
+    logger.debug(f"Using embedded {width}x{height} preview")
+    return encode_image(image, "jpeg", quality=quality, convert_to_jpg=True, timer=timer)
+
+def process_image(
+    image_data: bytes,
+    max_size: Optional[int] = None,
+    quality: int = 85,
+    convert_to_jpg: bool = True,
+    crop_portrait_to_square: bool = False,
+    target_aspect: Optional[float] = None,
+    allow_upscale: bool = False,
+    lossless: bool = True,
+    animate: bool = False,
+    max_frames: int = 100,
+    max_animation_bytes: Optional[int] = None,
+    timer=NULL_TIMER
+) -> bytes:
+    """
+    Process an image by scaling, rotating based on EXIF, and optionally converting to JPG.
+    Images that already match the output are returned unchanged, JPEGs that only
+    need rotating or cropping are transformed without re-encoding if possible.
+
+    Args:
+        image_data: Raw image data in bytes
+        max_size: Maximum width/height for scaling (None for no scaling)
+        quality: JPEG quality (1-100)
+        convert_to_jpg: Whether to convert the image to JPG format
+        crop_portrait_to_square: Whether to crop portrait images to 3:2 landscape format
+        target_aspect: Width / height ratio to crop the image to (None to keep the aspect ratio)
+        allow_upscale: Whether to enlarge images that are smaller than max_size
+        lossless: Whether to rotate and crop JPEGs losslessly when no scaling is needed
+        animate: Whether to convert GIFs to animated WebP instead of keeping the first frame
+        max_frames: Maximum number of frames of an animation
+        max_animation_bytes: Maximum size of an animation (None for no limit)
+        timer: RequestTimer collecting the duration of each processing stage
+
+    Returns:
+        Processed image data in bytes
+    """
+    try:
+        if animate and is_gif(image_data):
+            return process_animation(
+                image_data,
+                max_size=max_size,
+                quality=quality,
+                target_aspect=target_aspect,
+                allow_upscale=allow_upscale,
+                max_frames=max_frames,
+                max_output_bytes=max_animation_bytes,
+                timer=timer
+            )
+
+        with timer.stage("passthrough"):
+            passthrough = can_pass_through(
+                image_data,
+                max_size=max_size,
+                convert_to_jpg=convert_to_jpg,
+                crop_portrait_to_square=crop_portrait_to_square,
+                target_aspect=target_aspect,
+                allow_upscale=allow_upscale
+            )
+        if passthrough:
+            logger.debug("Image already matches the output, serving the original")
+            return image_data
+
+        if lossless:
+            with timer.stage("lossless"):
+                transformed = transform_losslessly(
+                    image_data,
+                    max_size=max_size,
+                    crop_portrait_to_square=crop_portrait_to_square,
+                    target_aspect=target_aspect,
+                    allow_upscale=allow_upscale
+                )
+            if transformed is not None:
+                return transformed
+
+        image, original_format = prepare_image(
+            image_data,
+            max_size=max_size,
+            crop_portrait_to_square=crop_portrait_to_square,
+            target_aspect=target_aspect,
+            allow_upscale=allow_upscale,
+            timer=timer
+        )
+        return encode_image(image, original_format, quality=quality, convert_to_jpg=convert_to_jpg, timer=timer)
 
     except Exception as e:
         logger.error(f"Error processing image: {e}")
         raise
 
-def scale_image(image: Image.Image, max_size: int) -> Image.Image:
+def process_image_pair(
+    image_data_pair: List[bytes],
+    max_size: int,
+    target_aspect: float,
+    quality: int = 85,
+    timer=NULL_TIMER
+) -> bytes:
+    """
+    Combine two portrait images side by side into one frame of the target aspect ratio.
+    Each image is cropped to fill its half of the frame.
+
+    Args:
+        image_data_pair: Raw image data of the left and right image
+        max_size: Maximum width/height of the frame
+        target_aspect: Width / height ratio of the frame
+        quality: JPEG quality (1-100)
+        timer: RequestTimer collecting the duration of each processing stage
+
+    Returns:
+        Processed JPG image data in bytes
+    """
+    try:
+        if target_aspect >= 1:
+            frame_width, frame_height = max_size, round(max_size / target_aspect)
+        else:
+            frame_width, frame_height = round(max_size * target_aspect), max_size
+        half_widths = [frame_width // 2, frame_width - frame_width // 2]
+
+        frame = Image.new('RGB', (frame_width, frame_height), (0, 0, 0))
+        paste_x = 0
+        for image_data, half_width in zip(image_data_pair, half_widths):
+            half, _ = prepare_image(
+                image_data,
+                max_size=max(half_width, frame_height),
+                target_aspect=half_width / frame_height,
+                timer=timer
+            )
+            if half.size != (half_width, frame_height):
+                with timer.stage("resize"):
+                    half = half.resize((half_width, frame_height), Image.Resampling.LANCZOS)
+            frame.paste(half.convert('RGB'), (paste_x, 0))
+            paste_x += half_width
+        logger.debug(f"Combined two portrait images into {frame_width}x{frame_height}")
+
+        return encode_image(frame, "jpeg", quality=quality, convert_to_jpg=True, timer=timer)
+
+    except Exception as e:
+        logger.error(f"Error processing image pair: {e}")
+        raise
+
+def scale_image(image: Image.Image, max_size: int, allow_upscale: bool = False) -> Image.Image:
     """
     Scale an image to fit within max_size while maintaining aspect ratio.
 
     Args:
         image: PIL Image object
         max_size: Maximum width/height
+        allow_upscale: Whether to enlarge images that are smaller than max_size
 
     Returns:
         Scaled PIL Image object
@@ -183,6 +797,10 @@ def scale_image(image: Image.Image, max_size: int) -> Image.Image:
     # Get current dimensions
     width, height = image.size
 
+    # Smaller images are left alone, upscaling only adds bytes and blur
+    if max(width, height) <= max_size and not allow_upscale:
+        return image
+
     # Calculate scaling factor
     if width > height:
         new_width = max_size
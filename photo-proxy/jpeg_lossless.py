@@ -0,0 +1,129 @@
+from io import BytesIO
+from typing import List, Optional, Tuple
+from PIL import Image
+import logging
+import shutil
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# jpegtran from libjpeg-turbo, None if it isn't installed
+JPEGTRAN = shutil.which("jpegtran")
+
+# Maximum number of seconds a single jpegtran call may take
+TIMEOUT = 30
+
+# jpegtran options that turn an image with the given EXIF orientation upright
+ORIENTATION_TRANSFORMS = {
+    2: ["-flip", "horizontal"],
+    3: ["-rotate", "180"],
+    4: ["-flip", "vertical"],
+    5: ["-transpose"],
+    6: ["-rotate", "90"],
+    7: ["-transverse"],
+    8: ["-rotate", "270"]
+}
+
+class LosslessTransformError(Exception):
+    """Raised when a JPEG can't be transformed without decoding it."""
+
+def is_available() -> bool:
+    """
+    Check whether lossless JPEG transforms are supported on this system.
+
+    Returns:
+        True if jpegtran is installed
+    """
+    return JPEGTRAN is not None
+
+def get_mcu_size(image: Image.Image) -> Tuple[int, int]:
+    """
+    Get the size of a minimum coded unit (MCU) of a JPEG image.
+    Lossless crops must start at a multiple of the MCU size.
+
+    Args:
+        image: PIL JPEG image (doesn't have to be loaded)
+
+    Returns:
+        Tuple of (width, height) of an MCU in pixels
+    """
+    layers = getattr(image, "layer", None) or []
+    if len(layers) <= 1:
+        return 8, 8
+    return 8 * max(layer[1] for layer in layers), 8 * max(layer[2] for layer in layers)
+
+def build_crop(
+    width: int,
+    height: int,
+    mcu_size: Tuple[int, int],
+    crop_box: Tuple[float, float, float, float]
+) -> str:
+    """
+    Convert a relative crop box into a jpegtran crop specification.
+    The top left corner is moved up and left onto the MCU grid, the size is kept,
+    so the aspect ratio of the crop is exact and the position is off by less than an MCU.
+
+    Args:
+        width: Width of the upright image
+        height: Height of the upright image
+        mcu_size: MCU size of the upright image
+        crop_box: Relative crop box (left, top, right, bottom)
+
+    Returns:
+        Crop specification in the form WxH+X+Y
+    """
+    left, top, right, bottom = crop_box
+    mcu_width, mcu_height = mcu_size
+    crop_width = min(round((right - left) * width), width)
+    crop_height = min(round((bottom - top) * height), height)
+    x = min(round(left * width) // mcu_width * mcu_width, width - crop_width)
+    y = min(round(top * height) // mcu_height * mcu_height, height - crop_height)
+    # Clamping to the right/bottom edge could leave the grid again
+    x -= x % mcu_width
+    y -= y % mcu_height
+    return f"{crop_width}x{crop_height}+{x}+{y}"
+
+def transform(
+    image_data: bytes,
+    orientation: int = 1,
+    crop_box: Optional[Tuple[float, float, float, float]] = None
+) -> bytes:
+    """
+    Rotate and crop a JPEG in the DCT domain, without decoding and re-encoding it.
+    Fails instead of touching pixels if the transform isn't lossless for this image
+    (e.g. when a rotation would move a partial MCU at the image edge).
+
+    Args:
+        image_data: Raw JPEG data in bytes
+        orientation: EXIF orientation of the image (1-8)
+        crop_box: Relative crop box of the upright image (None for no crop)
+
+    Returns:
+        Transformed JPEG data in bytes, without EXIF data
+
+    Raises:
+        LosslessTransformError: If jpegtran isn't installed or the transform isn't lossless
+    """
+    if not JPEGTRAN:
+        raise LosslessTransformError("jpegtran is not installed")
+
+    args: List[str] = [JPEGTRAN, "-perfect", "-copy", "icc"]
+    args += ORIENTATION_TRANSFORMS.get(orientation, [])
+    if crop_box and crop_box != (0.0, 0.0, 1.0, 1.0):
+        with Image.open(BytesIO(image_data)) as image:
+            width, height = image.size
+            mcu_width, mcu_height = get_mcu_size(image)
+        if orientation in (5, 6, 7, 8):
+            # The crop is applied to the rotated image, where width and height are swapped
+            width, height = height, width
+            mcu_width, mcu_height = mcu_height, mcu_width
+        args += ["-crop", build_crop(width, height, (mcu_width, mcu_height), crop_box)]
+
+    try:
+        result = subprocess.run(args, input=image_data, capture_output=True, timeout=TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise LosslessTransformError(f"jpegtran failed: {e}")
+    if result.returncode != 0 or not result.stdout:
+        raise LosslessTransformError(f"jpegtran failed: {result.stderr.decode(errors='replace').strip()}")
+    logger.debug(f"Transformed JPEG losslessly with {' '.join(args[1:])}")
+    return result.stdout
@@ -0,0 +1,793 @@
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+import fcntl
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+class LibraryIndex:
+    """
+    Index of the images available in the configured Nextcloud folders.
+    Keeps the last listing together with a precomputed summary so the status page
+    and the image API don't need to rescan the library on every request.
+    If a database path is given, the index is persisted in SQLite and shared between
+    worker processes: only one process scans Nextcloud, the others reload the result.
+    Copies of the same picture (same size and etag, or same perceptual hash) are grouped:
+    selection only sees one image per group and all copies share its cache entries.
+    """
+    SORT_KEYS = ("name", "path", "folder", "size", "modified")
+    # Fields probed from the image itself, kept across rescans while the file is unchanged
+    METADATA_KEYS = ("width", "height", "orientation", "format", "metadata_failed", "phash")
+    # Maximum difference between image and target aspect ratio, as log ratio (~15%)
+    ASPECT_TOLERANCE = 0.15
+    # Maximum number of differing bits between the perceptual hashes of copies of a picture.
+    # Hashes are bucketed by PHASH_MAX_DISTANCE + 1 bands, so copies share at least one band
+    PHASH_MAX_DISTANCE = 3
+    # Seconds between checks whether another process updated the shared index
+    RELOAD_CHECK_INTERVAL = 5
+
+    def __init__(self, nextcloud_client, max_age: int = 3600, db_path: Optional[str] = None):
+        """
+        Initialize the index. A persisted index is loaded by the first reload_if_changed call,
+        so creating the index stays fast even for large libraries.
+
+        Args:
+            nextcloud_client: NextcloudClient used to list the configured folders
+            max_age: Number of seconds after which the index is considered stale
+            db_path: Path of the SQLite database to share the index (None to keep it in memory only)
+        """
+        self.nextcloud_client = nextcloud_client
+        self.max_age = max_age
+        self.images: List[Dict] = []
+        self.last_sync: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.version: Optional[str] = None
+        # Last change of the probed metadata in the shared index that is loaded
+        self.metadata_version = 0
+        self._summary: Dict = self._build_summary([])
+        self._sorted: Dict[tuple, List[Dict]] = {}
+        self._by_path: Dict[str, Dict] = {}
+        self._aspect_views: Dict = {}
+        self._crawler_lock_file = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.db_path = db_path
+        self._last_reload_check = 0.0
+        if db_path:
+            with self._connect() as db:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("CREATE TABLE IF NOT EXISTS images (path TEXT PRIMARY KEY, data TEXT NOT NULL)")
+                db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+                columns = [row[1] for row in db.execute("PRAGMA table_info(images)")]
+                if "metadata_version" not in columns:
+                    # Metadata change in which the entry was last updated, so other processes only reload those
+                    db.execute("ALTER TABLE images ADD COLUMN metadata_version INTEGER NOT NULL DEFAULT 0")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """
+        Open a connection to the index database, committed and closed on exit.
+
+        Returns:
+            SQLite connection
+        """
+        db = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def _scan_lock(self) -> Iterator[bool]:
+        """
+        Try to become the process that scans Nextcloud.
+        If another process holds the lock, waits for it to finish.
+
+        Returns:
+            True if this process holds the lock and should scan, False if another process scanned
+        """
+        if not self.db_path:
+            yield True
+            return
+        with open(f"{self.db_path}.lock", "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                acquired = True
+            except BlockingIOError:
+                logger.info("Library index is being refreshed by another worker, waiting for it")
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                acquired = False
+            try:
+                yield acquired
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def try_lock_crawler(self) -> bool:
+        """
+        Try to become the process that crawls image metadata.
+        The lock is held until the process exits.
+
+        Returns:
+            True if this process should crawl
+        """
+        if self._crawler_lock_file:
+            return True
+        if not self.db_path:
+            return True
+        lock_file = open(f"{self.db_path}.crawl.lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._crawler_lock_file = lock_file
+        return True
+
+    @staticmethod
+    def _new_version() -> str:
+        """
+        Create a token identifying a change of the shared index.
+
+        Returns:
+            Version token
+        """
+        return f"{time.time()}-{os.getpid()}"
+
+    def _set_images(self, images: List[Dict], last_sync: float, version: Optional[str] = None, metadata_version: int = 0) -> None:
+        """
+        Replace the indexed images in memory.
+
+        Args:
+            images: Normalized image entries
+            last_sync: Time of the scan that produced the images
+            version: Version of the shared index the images were loaded from
+            metadata_version: Last metadata change of the shared index included in the images
+        """
+        summary = self._build_summary(images)
+        by_path = {image["path"]: image for image in images}
+        with self._lock:
+            self.images = images
+            self._by_path = by_path
+            self._summary = summary
+            self._sorted = {}
+            self._aspect_views = {}
+            self.last_sync = last_sync
+            self.version = version
+            self.metadata_version = metadata_version
+
+    @staticmethod
+    def _get_meta(db: sqlite3.Connection) -> Dict[str, str]:
+        """
+        Read the state of the shared index.
+
+        Args:
+            db: Connection to the index database
+
+        Returns:
+            Dictionary with the last sync time, the version and the metadata version
+        """
+        return dict(db.execute("SELECT key, value FROM meta").fetchall())
+
+    def _merge_metadata(self, rows: List[str], by_path: Dict[str, Dict]) -> int:
+        """
+        Copy probed metadata from stored entries to the entries of the same files,
+        unless the file was modified since.
+
+        Args:
+            rows: Stored image entries as JSON
+            by_path: Image entries to update by path
+
+        Returns:
+            Number of updated entries
+        """
+        merged = 0
+        for data in rows:
+            stored = json.loads(data)
+            image = by_path.get(stored["path"])
+            if image is None or image["size"] != stored["size"] or image["modified"] != stored["modified"]:
+                continue
+            image.update({key: stored[key] for key in self.METADATA_KEYS if key in stored})
+            merged += 1
+        return merged
+
+    def _store(self, images: List[Dict], last_sync: float) -> Tuple[str, int]:
+        """
+        Persist the indexed images so other processes can load them.
+        Metadata that other processes stored during the scan is merged into the images first.
+
+        Args:
+            images: Normalized image entries
+            last_sync: Time of the scan that produced the images
+
+        Returns:
+            New version and metadata version of the shared index
+        """
+        version = self._new_version()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            rows = db.execute(
+                "SELECT data FROM images WHERE metadata_version > ?", (self.metadata_version,)
+            ).fetchall()
+            self._merge_metadata([data for (data,) in rows], {image["path"]: image for image in images})
+            metadata_version = int(self._get_meta(db).get("metadata_version", 0))
+            db.execute("DELETE FROM images")
+            db.executemany(
+                "INSERT INTO images (path, data) VALUES (?, ?)",
+                [(image["path"], json.dumps(image)) for image in images]
+            )
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_sync', ?)", (str(last_sync),))
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (version,))
+        return version, metadata_version
+
+    def reload_if_changed(self, force: bool = False) -> None:
+        """
+        Load the persisted index if another process refreshed it.
+        If only metadata changed, just the updated entries are loaded.
+        Checks at most every RELOAD_CHECK_INTERVAL seconds unless forced.
+
+        Args:
+            force: Check the database regardless of the last check
+        """
+        if not self.db_path:
+            return
+        now = time.time()
+        if not force and now - self._last_reload_check < self.RELOAD_CHECK_INTERVAL:
+            return
+        self._last_reload_check = now
+
+        with self._connect() as db:
+            # Read the state and the entries from the same snapshot
+            db.execute("BEGIN")
+            meta = self._get_meta(db)
+            if "last_sync" not in meta:
+                return
+            metadata_version = int(meta.get("metadata_version", 0))
+            if meta.get("version") == self.version:
+                if metadata_version == self.metadata_version:
+                    return
+                rows = db.execute(
+                    "SELECT data FROM images WHERE metadata_version > ?", (self.metadata_version,)
+                ).fetchall()
+                with self._lock:
+                    merged = self._merge_metadata([data for (data,) in rows], self._by_path)
+                    self.metadata_version = metadata_version
+                    self._aspect_views = {}
+                logger.debug(f"Loaded metadata of {merged} images from {self.db_path}")
+                return
+            images = [json.loads(data) for (data,) in db.execute("SELECT data FROM images")]
+        self._set_images(images, float(meta["last_sync"]), meta.get("version"), metadata_version)
+        logger.info(f"Loaded library index with {len(images)} images from {self.db_path}")
+
+    @staticmethod
+    def _normalize(image: Dict) -> Dict:
+        """
+        Normalize an entry of the Nextcloud listing for the index.
+
+        Args:
+            image: Image information as returned by NextcloudClient.list_pictures
+
+        Returns:
+            Image information with JSON serializable values
+        """
+        modified = image.get("modified", "")
+        if isinstance(modified, datetime):
+            modified = modified.isoformat()
+        return {
+            **image,
+            "size": image.get("size") or 0,
+            "modified": modified or "",
+            "folder": image.get("folder", "")
+        }
+
+    @staticmethod
+    def _build_summary(images: List[Dict]) -> Dict:
+        """
+        Compute image counts and sizes per folder.
+
+        Args:
+            images: Normalized image entries
+
+        Returns:
+            Dictionary with totals and per-folder statistics
+        """
+        folders: Dict[str, Dict[str, int]] = {}
+        for image in images:
+            folder = folders.setdefault(image["folder"], {"count": 0, "bytes": 0})
+            folder["count"] += 1
+            folder["bytes"] += image["size"]
+        return {
+            "total_images": len(images),
+            "total_bytes": sum(folder["bytes"] for folder in folders.values()),
+            "folders": dict(sorted(folders.items()))
+        }
+
+    def refresh(self, force: bool = False) -> List[str]:
+        """
+        Rescan all configured folders and replace the index.
+        Concurrent calls are collapsed into a single scan, also across processes sharing
+        the index database. If the scan fails, the last known index is kept and the error is recorded.
+
+        Args:
+            force: Scan even if another process refreshed the shared index in the meantime
+
+        Returns:
+            Paths of the images that were modified or removed since the previous index
+            (empty if the scan was done by another thread or process)
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            # Another refresh is running, wait for it instead of scanning again
+            with self._refresh_lock:
+                return []
+        try:
+            with self._scan_lock() as acquired:
+                if self.db_path:
+                    # Another process may have refreshed the shared index in the meantime
+                    self.reload_if_changed(force=True)
+                    if not acquired or (not force and not self.needs_refresh()):
+                        return []
+
+                start = time.perf_counter()
+                previous = self.images
+                try:
+                    images = [self._normalize(image) for image in self.nextcloud_client.list_pictures()]
+                    self._carry_over_metadata(images)
+                except Exception as e:
+                    self.last_error = str(e) or type(e).__name__
+                    logger.error(f"Failed to refresh library index, keeping {len(self.images)} known images: {self.last_error}")
+                    raise
+                last_sync = time.time()
+                version, metadata_version = self._store(images, last_sync) if self.db_path else (None, 0)
+                self._set_images(images, last_sync, version, metadata_version)
+                self.last_error = None
+                logger.info(f"Refreshed library index with {len(images)} images in {time.perf_counter() - start:.2f}s")
+                return self._get_changed_paths(previous, images)
+        finally:
+            self._refresh_lock.release()
+
+    def refresh_folder(self, folder: str) -> List[str]:
+        """
+        Rescan a single configured folder and replace only its images in the index,
+        e.g. after an album was reorganized. The images of the other folders are kept as they are.
+
+        Args:
+            folder: Configured folder to rescan
+
+        Returns:
+            Paths of the images in the folder that were modified or removed
+
+        Raises:
+            ValueError: If the folder is not one of the configured folders
+        """
+        # Index entries carry the folder as configured, without surrounding slashes
+        configured = {directory.strip().strip("/"): directory.strip("/") for directory in self.nextcloud_client.directories}
+        if folder.strip().strip("/") not in configured:
+            raise ValueError(f"Folder is not configured: {folder}")
+        folder = configured[folder.strip().strip("/")]
+
+        with self._refresh_lock, self._scan_lock():
+            # Start from the latest shared index, another process may have refreshed it
+            self.reload_if_changed(force=True)
+            start = time.perf_counter()
+            listing = [
+                self._normalize(image)
+                for image in self.nextcloud_client.list_pictures(folder, use_cache=False)
+            ]
+            self._carry_over_metadata(listing)
+            previous = [image for image in self.images if image["folder"] == folder]
+            images = [image for image in self.images if image["folder"] != folder] + listing
+            # The other folders weren't rescanned, so the index doesn't get fresher
+            last_sync = self.last_sync or time.time()
+            version, metadata_version = self._store(images, last_sync) if self.db_path else (None, 0)
+            self._set_images(images, last_sync, version, metadata_version)
+        logger.info(f"Refreshed folder {folder} with {len(listing)} images in {time.perf_counter() - start:.2f}s")
+        return self._get_changed_paths(previous, listing)
+
+    @staticmethod
+    def _get_changed_paths(previous: List[Dict], images: List[Dict]) -> List[str]:
+        """
+        Compare two listings and find the images whose processed versions are outdated.
+
+        Args:
+            previous: Normalized image entries of the previous listing
+            images: Normalized image entries of the new listing
+
+        Returns:
+            Paths of the images that were modified or removed
+        """
+        current = {image["path"]: image for image in images}
+        changed = []
+        for image in previous:
+            new = current.get(image["path"])
+            if new is None or new["size"] != image["size"] or new["modified"] != image["modified"]:
+                changed.append(image["path"])
+        return changed
+
+    def _carry_over_metadata(self, images: List[Dict]) -> None:
+        """
+        Copy probed metadata from the current index to a new listing for unchanged files.
+
+        Args:
+            images: Normalized image entries of the new listing
+        """
+        for image in images:
+            previous = self._by_path.get(image["path"])
+            if previous and previous["size"] == image["size"] and previous["modified"] == image["modified"]:
+                for key in self.METADATA_KEYS:
+                    if key in previous:
+                        image[key] = previous[key]
+
+    def set_metadata(self, updates: Dict[str, Dict]) -> None:
+        """
+        Store metadata probed from images (e.g. dimensions) in the index.
+        Only the given fields are written, so concurrent updates of other fields by other
+        processes are kept. Metadata changes don't require other processes to reload the whole index.
+
+        Args:
+            updates: Metadata fields per image path
+        """
+        changed = {}
+        with self._lock:
+            for path, fields in updates.items():
+                image = self._by_path.get(path)
+                if image is not None:
+                    image.update(fields)
+                    changed[path] = (image, fields)
+            self._aspect_views = {}
+        if not changed or not self.db_path:
+            return
+
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            meta = self._get_meta(db)
+            metadata_version = int(meta.get("metadata_version", 0)) + 1
+            rows = []
+            for path, (image, fields) in changed.items():
+                row = db.execute("SELECT data FROM images WHERE path = ?", (path,)).fetchone()
+                if row is None:
+                    continue
+                stored = json.loads(row[0])
+                # The metadata was probed from the file as indexed here, skip it if the file changed
+                if stored["size"] != image["size"] or stored["modified"] != image["modified"]:
+                    continue
+                stored.update(fields)
+                rows.append((json.dumps(stored), metadata_version, path))
+            db.executemany("UPDATE images SET data = ?, metadata_version = ? WHERE path = ?", rows)
+            db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('metadata_version', ?)", (str(metadata_version),)
+            )
+        if meta.get("version") != self.version:
+            # Another process replaced the index in the meantime
+            self.reload_if_changed(force=True)
+        elif int(meta.get("metadata_version", 0)) == self.metadata_version:
+            # Nothing was missed, the stored metadata is the same as in memory
+            self.metadata_version = metadata_version
+
+    def get_image(self, path: str) -> Optional[Dict]:
+        """
+        Get an indexed image by path.
+
+        Args:
+            path: Path of the image in Nextcloud
+
+        Returns:
+            Image entry, None if the image is not indexed
+        """
+        return self._by_path.get(path)
+
+    def get_images_without_metadata(self, limit: int = 50) -> List[Dict]:
+        """
+        Get images whose dimensions haven't been probed yet.
+
+        Args:
+            limit: Maximum number of images to return
+
+        Returns:
+            List of image entries
+        """
+        pending = []
+        for image in self.images:
+            if "width" not in image and not image.get("metadata_failed"):
+                pending.append(image)
+                if len(pending) >= limit:
+                    break
+        return pending
+
+    @staticmethod
+    def is_portrait(image: Dict) -> bool:
+        """
+        Check whether an indexed image is known to be in portrait orientation.
+
+        Args:
+            image: Image entry
+
+        Returns:
+            True if the image is taller than wide
+        """
+        return bool(image.get("width")) and image["height"] > image["width"]
+
+    @staticmethod
+    def _build_duplicates(images: List[Dict]) -> Dict[str, str]:
+        """
+        Group copies of the same picture: files with the same size and etag, and images whose
+        perceptual hashes differ by at most PHASH_MAX_DISTANCE bits (e.g. scaled or re-encoded
+        copies synced from another device). Only images sharing a band of their hash are compared,
+        as in locality-sensitive hashing. Perceptual hash matches also need the same aspect ratio,
+        so pictures with a similar layout but different dimensions aren't merged.
+        The largest file of a group represents it, since smaller copies are usually downscaled.
+
+        Args:
+            images: Normalized image entries
+
+        Returns:
+            Path of the representing image for the path of every other copy
+        """
+        parent: Dict[str, str] = {}
+
+        def find(path: str) -> str:
+            while parent.get(path, path) != path:
+                path = parent[path]
+            return path
+
+        def union(path: str, other_path: str) -> None:
+            root, other_root = find(path), find(other_path)
+            if root != other_root:
+                parent[root] = other_root
+
+        bands = LibraryIndex.PHASH_MAX_DISTANCE + 1
+        groups: Dict[tuple, List[str]] = {}
+        buckets: Dict[tuple, List[str]] = {}
+        hashes: Dict[str, int] = {}
+        for image in images:
+            if image.get("etag"):
+                groups.setdefault(("etag", image["size"], image["etag"]), []).append(image["path"])
+            if image.get("phash") and image.get("width") and image.get("height"):
+                aspect = round(image["width"] / image["height"], 2)
+                bits = hashes[image["path"]] = int(image["phash"], 16)
+                for band in range(bands):
+                    start, end = 64 * band // bands, 64 * (band + 1) // bands
+                    band_bits = (bits >> start) & ((1 << (end - start)) - 1)
+                    buckets.setdefault((band, band_bits, aspect), []).append(image["path"])
+        for paths in groups.values():
+            for path in paths[1:]:
+                union(path, paths[0])
+        for paths in buckets.values():
+            for index, path in enumerate(paths):
+                for other_path in paths[index + 1:]:
+                    if bin(hashes[path] ^ hashes[other_path]).count("1") <= LibraryIndex.PHASH_MAX_DISTANCE:
+                        union(path, other_path)
+        if not parent:
+            return {}
+
+        by_path = {image["path"]: image for image in images}
+        components: Dict[str, List[Dict]] = {}
+        for path in parent:
+            components.setdefault(find(path), []).append(by_path[path])
+        duplicates = {}
+        for root, members in components.items():
+            if root not in parent:
+                members.append(by_path[root])
+            canonical = min(members, key=lambda image: (-image["size"], image["path"]))
+            for image in members:
+                if image is not canonical:
+                    duplicates[image["path"]] = canonical["path"]
+        return duplicates
+
+    def _get_duplicates(self) -> Dict[str, str]:
+        """
+        Get the duplicate groups, cached until the index or its metadata changes. Call with the lock held.
+
+        Returns:
+            Path of the representing image for the path of every other copy
+        """
+        view = self._aspect_views.get("duplicates")
+        if view is None:
+            view = self._build_duplicates(self.images)
+            self._aspect_views["duplicates"] = view
+        return view
+
+    def get_canonical_path(self, path: str) -> str:
+        """
+        Get the image representing the copies of a picture, whose cache entries all copies share.
+
+        Args:
+            path: Path of an image in Nextcloud
+
+        Returns:
+            Path of the representing image (the path itself if the image has no copies)
+        """
+        with self._lock:
+            return self._get_duplicates().get(path, path)
+
+    def _get_unique_images(self) -> List[Dict]:
+        """
+        Get the indexed images without copies. Call with the lock held.
+
+        Returns:
+            List of image entries, one per picture
+        """
+        view = self._aspect_views.get("unique")
+        if view is None:
+            duplicates = self._get_duplicates()
+            view = [image for image in self.images if image["path"] not in duplicates] if duplicates else self.images
+            self._aspect_views["unique"] = view
+        return view
+
+    def get_unique_images(self) -> List[Dict]:
+        """
+        Get the indexed images for selection, with one image per picture.
+
+        Returns:
+            List of image entries
+        """
+        with self._lock:
+            return self._get_unique_images()
+
+    def get_images_for_aspect(self, target_aspect: float) -> List[Dict]:
+        """
+        Get the images whose aspect ratio is close to the target aspect ratio.
+        Images with unknown dimensions are not included.
+
+        Args:
+            target_aspect: Target width / height ratio
+
+        Returns:
+            List of matching image entries (may be empty)
+        """
+        key = ("aspect", round(target_aspect, 3))
+        with self._lock:
+            view = self._aspect_views.get(key)
+            if view is None:
+                view = [
+                    image for image in self._get_unique_images()
+                    if image.get("width") and image.get("height")
+                    and abs(math.log(image["width"] / image["height"] / target_aspect)) <= self.ASPECT_TOLERANCE
+                ]
+                self._aspect_views[key] = view
+        return view
+
+    def _get_portraits(self) -> Tuple[List[Dict], Dict[str, int]]:
+        """
+        Get all images known to be portraits, in a stable order.
+
+        Returns:
+            Tuple of (portrait image entries sorted by path, position of each path)
+        """
+        with self._lock:
+            view = self._aspect_views.get("portraits")
+            if view is None:
+                portraits = sorted(
+                    (image for image in self._get_unique_images() if self.is_portrait(image)),
+                    key=lambda image: image["path"]
+                )
+                view = (portraits, {image["path"]: i for i, image in enumerate(portraits)})
+                self._aspect_views["portraits"] = view
+        return view
+
+    def get_portrait_pairs(self) -> List[Dict]:
+        """
+        Get the first image of every portrait pair.
+
+        Returns:
+            List of portrait image entries that have a partner
+        """
+        portraits, _ = self._get_portraits()
+        return portraits[0:len(portraits) - 1:2]
+
+    def get_portrait_partner(self, image: Dict) -> Optional[Dict]:
+        """
+        Get the fixed partner of a portrait, so combined frames can be cached.
+        Portraits are paired in path order: 1st with 2nd, 3rd with 4th and so on.
+
+        Args:
+            image: Portrait image entry
+
+        Returns:
+            Partner image entry, None if there is no other portrait
+        """
+        portraits, positions = self._get_portraits()
+        position = positions.get(image["path"])
+        if position is None or len(portraits) < 2:
+            return None
+        partner = position ^ 1
+        if partner >= len(portraits):
+            # Odd number of portraits, the last one shares the partner of its neighbour
+            partner = position - 1
+        return portraits[partner]
+
+    def needs_refresh(self) -> bool:
+        """
+        Check whether the index was never synced or is older than max_age.
+
+        Returns:
+            True if the index should be refreshed
+        """
+        return self.last_sync is None or time.time() - self.last_sync > self.max_age
+
+    def is_refreshing(self) -> bool:
+        """
+        Check whether a refresh is currently running.
+
+        Returns:
+            True if a refresh is running
+        """
+        return self._refresh_lock.locked()
+
+    def get_state(self) -> Dict:
+        """
+        Get the freshness of the index for health reporting.
+
+        Returns:
+            Dictionary with image count, last sync time, staleness and last refresh error
+        """
+        return {
+            "images": len(self.images),
+            "last_sync": self.last_sync,
+            "stale": self.needs_refresh(),
+            "refreshing": self.is_refreshing(),
+            "last_error": self.last_error
+        }
+
+    def get_images(self) -> List[Dict]:
+        """
+        Get all indexed images.
+
+        Returns:
+            List of image entries
+        """
+        return self.images
+
+    def get_summary(self) -> Dict:
+        """
+        Get the library summary.
+
+        Returns:
+            Dictionary with total images, total bytes, per-folder statistics, number of
+            duplicate copies and last sync time
+        """
+        with self._lock:
+            return {**self._summary, "duplicates": len(self._get_duplicates()), "last_sync": self.last_sync}
+
+    def get_page(self, offset: int = 0, limit: int = 100, sort: str = "name", order: str = "asc") -> Dict:
+        """
+        Get a page of the indexed images.
+
+        Args:
+            offset: Index of the first image to return
+            limit: Maximum number of images to return
+            sort: Key to sort by (one of SORT_KEYS)
+            order: Sort order, "asc" or "desc"
+
+        Returns:
+            Dictionary with the total number of images and the requested page
+
+        Raises:
+            ValueError: If sort or order is invalid
+        """
+        if sort not in self.SORT_KEYS:
+            raise ValueError(f"Invalid sort key: {sort}")
+        if order not in ("asc", "desc"):
+            raise ValueError(f"Invalid sort order: {order}")
+
+        with self._lock:
+            # Sorted views are cached until the next refresh
+            view = self._sorted.get((sort, order))
+            if view is None:
+                view = sorted(self.images, key=lambda image: image[sort], reverse=order == "desc")
+                self._sorted[(sort, order)] = view
+
+        return {
+            "total": len(view),
+            "offset": offset,
+            "limit": limit,
+            "sort": sort,
+            "order": order,
+            "images": view[offset:offset + limit]
+        }
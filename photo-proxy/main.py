@@ -1,20 +1,33 @@
-from fastapi import FastAPI, Response, HTTPException
-from fastapi.responses import StreamingResponse, HTMLResponse
+from fastapi import FastAPI, Response, HTTPException, Query, Depends, Header
+from fastapi.responses import StreamingResponse, HTMLResponse, PlainTextResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-import aiohttp
 import random
 import asyncio
-from typing import List, Dict, Optional, Tuple
+import functools
+import hashlib
+from typing import List, Dict, Optional, Tuple, Union
 import logging
 import os
 import json
-from nextcloud_client import NextcloudClient
+import posixpath
+import resource
+import secrets
+import time
+from nextcloud_client import NextcloudClient, PreviewNotAvailableError, is_unavailable_error
 from dotenv import load_dotenv
 import traceback
+from urllib.parse import quote, urlencode
 from status_page import generate_status_page
-from image_utils import process_image
 from slideshow_page import generate_slideshow_page
+from slideshow_rooms import SlideshowScheduler
 from image_cache import ImageCache
+from disk_cache import DiskCache, MAPPING_KEEPS_FD
+from library_index import LibraryIndex
+from admission import AdmissionController, AdmissionRejectedError
+from circuit_breaker import CircuitOpenError
+from fetch_scheduler import fetch_priority, PREFETCH, BACKGROUND
+from timing import SlowRequestLog, start_timer, NULL_TIMER
+from profiler import SamplingProfiler, ProfilerBusyError
 
 # Configure logging with timestamp
 logging.basicConfig(
@@ -72,6 +85,11 @@ NEXTCLOUD_USERNAME = config.get("nextcloud_username")
 NEXTCLOUD_PASSWORD = config.get("nextcloud_password")
 NEXTCLOUD_DIRS = config.get("nextcloud_dirs", "Pictures").split(",")
 
+# Get Nextcloud request scheduling settings, the caps only apply to prefetching and scans
+NEXTCLOUD_MAX_CONNECTIONS = int(os.getenv("NEXTCLOUD_MAX_CONNECTIONS", config.get("nextcloud_max_connections", 4)))
+NEXTCLOUD_BANDWIDTH_LIMIT_MBIT = float(os.getenv("NEXTCLOUD_BANDWIDTH_LIMIT_MBIT", config.get("nextcloud_bandwidth_limit_mbit", 0)))
+NEXTCLOUD_REQUEST_RATE = float(os.getenv("NEXTCLOUD_REQUEST_RATE", config.get("nextcloud_request_rate", 0)))
+
 # Initialize Nextcloud client only if URL is set
 nextcloud_client = None
 if NEXTCLOUD_URL and NEXTCLOUD_USERNAME and NEXTCLOUD_PASSWORD:
@@ -81,7 +99,10 @@ if NEXTCLOUD_URL and NEXTCLOUD_USERNAME and NEXTCLOUD_PASSWORD:
         url=NEXTCLOUD_URL,
         username=NEXTCLOUD_USERNAME,
         password=NEXTCLOUD_PASSWORD,
-        directories=NEXTCLOUD_DIRS
+        directories=NEXTCLOUD_DIRS,
+        max_connections=NEXTCLOUD_MAX_CONNECTIONS,
+        max_bytes_per_second=NEXTCLOUD_BANDWIDTH_LIMIT_MBIT * 1000 * 1000 / 8,
+        max_requests_per_second=NEXTCLOUD_REQUEST_RATE
     )
 else:
     logger.error("Nextcloud integration disabled - missing credentials")
@@ -89,169 +110,1412 @@ else:
 
 # Global state for /next endpoint
 _current_index = 0
-_all_images = []
 
 # Get image processing settings from environment
 MAX_IMAGE_SIZE = int(os.getenv("MAX_IMAGE_SIZE", config.get("max_image_size", 1920)))
 JPG_QUALITY = int(os.getenv("JPG_QUALITY", config.get("jpg_quality", 85)))
 CONVERT_TO_JPG = os.getenv("CONVERT_TO_JPG", config.get("convert_to_jpg", True))
 CROP_PORTRAIT_TO_SQUARE = os.getenv("CROP_PORTRAIT_TO_SQUARE", config.get("crop_portrait_to_square", False))
+ALLOW_UPSCALE = str(os.getenv("ALLOW_UPSCALE", config.get("allow_upscale", False))).lower() == "true"
+LOSSLESS_JPEG = str(os.getenv("LOSSLESS_JPEG", config.get("lossless_jpeg", True))).lower() == "true"
+PAIR_PORTRAITS = str(os.getenv("PAIR_PORTRAITS", config.get("pair_portraits", False))).lower() == "true"
+METADATA_CRAWL = str(os.getenv("METADATA_CRAWL", config.get("metadata_crawl", True))).lower() == "true"
+
+# Get animated GIF settings
+GIF_MODE = os.getenv("GIF_MODE", config.get("gif_mode", "first_frame"))
+MAX_GIF_SIZE_MB = float(os.getenv("MAX_GIF_SIZE_MB", config.get("max_gif_size_mb", 10)))
+MAX_GIF_FRAMES = int(os.getenv("MAX_GIF_FRAMES", config.get("max_gif_frames", 100)))
+MAX_ANIMATION_SIZE_MB = float(os.getenv("MAX_ANIMATION_SIZE_MB", config.get("max_animation_size_mb", 5)))
+
+# Get HEIC/HEIF and AVIF settings
+HEIF_PREVIEWS = str(os.getenv("HEIF_PREVIEWS", config.get("heif_previews", True))).lower() == "true"
+PREVIEW_EXTENSIONS = ('.heic', '.heif', '.avif')
+
+# Get embedded preview setting
+EMBEDDED_PREVIEWS = str(os.getenv("EMBEDDED_PREVIEWS", config.get("embedded_previews", True))).lower() == "true"
+
+# Get library index settings
+INDEX_REFRESH_INTERVAL = int(os.getenv("INDEX_REFRESH_INTERVAL", config.get("index_refresh_interval", 3600)))
+
+# Get worker and shared cache settings
+WORKERS = int(os.getenv("WORKERS", config.get("workers", 1)))
+CACHE_DIR = os.getenv("CACHE_DIR", config.get("cache_dir", "/data/cache" if os.path.isdir("/data") else "cache"))
+MEMORY_CACHE_SIZE = int(os.getenv("MEMORY_CACHE_SIZE", config.get("memory_cache_size", 500)))
+DISK_CACHE_SIZE_MB = int(os.getenv("DISK_CACHE_SIZE_MB", config.get("disk_cache_size_mb", 500)))
+# Serve cached images from memory-mapped disk cache files instead of copies in memory
+MMAP_CACHE = str(os.getenv("MMAP_CACHE", config.get("mmap_cache", False))).lower() == "true"
+
+# File descriptors kept free for connections, the databases and Nextcloud requests
+OPEN_FILE_HEADROOM = 1024
+
+# Get admission control settings for cache misses
+MAX_CONCURRENT_PROCESSING = int(os.getenv("MAX_CONCURRENT_PROCESSING", config.get("max_concurrent_processing", 2)))
+MAX_PROCESSING_QUEUE = int(os.getenv("MAX_PROCESSING_QUEUE", config.get("max_processing_queue", 16)))
+RETRY_AFTER_SECONDS = 5
+
+# Get request timing settings
+SERVER_TIMING = str(os.getenv("SERVER_TIMING", config.get("server_timing", True))).lower() == "true"
+SLOW_REQUEST_LOG_SIZE = int(os.getenv("SLOW_REQUEST_LOG_SIZE", config.get("slow_request_log_size", 20)))
+
+# Get slideshow settings
+SLIDESHOW_INTERVAL = float(os.getenv("SLIDESHOW_INTERVAL", config.get("slideshow_interval", 10)))
+SLIDESHOW_LEAD_TIME = float(os.getenv("SLIDESHOW_LEAD_TIME", config.get("slideshow_lead_time", 5)))
+SLIDESHOW_MAX_LOOKAHEAD = int(os.getenv("SLIDESHOW_MAX_LOOKAHEAD", config.get("slideshow_max_lookahead", 3)))
+
+# Get profiler setting
+ENABLE_PROFILER = str(os.getenv("ENABLE_PROFILER", config.get("enable_profiler", False))).lower() == "true"
+
+# Get admin API settings, the admin API is disabled without a token
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", config.get("admin_token", "")) or ""
+# Seconds between checks for images invalidated by another worker process
+INVALIDATION_CHECK_INTERVAL = 5
 
 # Initialize image cache
-image_cache = ImageCache(max_size=500)
+image_cache = ImageCache(max_size=MEMORY_CACHE_SIZE)
 logger.info("Initialized image cache")
 
-async def get_nextcloud_images() -> List[Dict]:
-    """Get list of images from configured Nextcloud folders."""
-    if not nextcloud_client:
-        logger.error("Nextcloud integration is not enabled")
-        return []
+# Initialize disk cache shared by all worker processes
+os.makedirs(CACHE_DIR, exist_ok=True)
+disk_cache = None
+if DISK_CACHE_SIZE_MB > 0:
+    disk_cache = DiskCache(CACHE_DIR, max_size_mb=DISK_CACHE_SIZE_MB)
+    logger.info(f"Initialized disk cache in {CACHE_DIR} ({DISK_CACHE_SIZE_MB} MB)")
+elif WORKERS > 1:
+    logger.warning("Disk cache is disabled, workers will process and cache images separately")
+if MMAP_CACHE and not disk_cache:
+    logger.warning("Memory-mapped cache requires the disk cache, keeping images in memory")
+    MMAP_CACHE = False
 
+def raise_open_file_limit(required: int) -> bool:
+    """
+    Raise the limit of open files of the process up to its hard limit.
+
+    Args:
+        required: Number of file descriptors the process needs
+
+    Returns:
+        True if the limit allows the required number of open files
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < required:
+        limit = required if hard == resource.RLIM_INFINITY else min(required, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+            logger.info(f"Raised open file limit from {soft} to {limit}")
+        except (ValueError, OSError) as e:
+            logger.warning(f"Failed to raise open file limit: {e}")
+            return False
+        return limit >= required
+    return True
+
+if MMAP_CACHE and MAPPING_KEEPS_FD:
+    # Every mapped image in the memory cache holds a file descriptor
+    required_files = MEMORY_CACHE_SIZE + OPEN_FILE_HEADROOM
+    if not raise_open_file_limit(required_files):
+        logger.warning(
+            f"Memory-mapped cache needs {required_files} open files but the limit is lower, "
+            "keeping images in memory. Raise the open file limit (ulimit -n) or reduce memory_cache_size"
+        )
+        MMAP_CACHE = False
+
+# Initialize library index, shared by all worker processes through SQLite
+library_index = LibraryIndex(
+    nextcloud_client,
+    max_age=INDEX_REFRESH_INTERVAL,
+    db_path=os.path.join(CACHE_DIR, "index.db")
+)
+
+# Initialize admission control for cache misses
+admission_controller = AdmissionController(
+    max_concurrent=MAX_CONCURRENT_PROCESSING,
+    max_queue=MAX_PROCESSING_QUEUE
+)
+
+# Initialize log of the slowest image requests
+slow_request_log = SlowRequestLog(max_entries=SLOW_REQUEST_LOG_SIZE if SERVER_TIMING else 0)
+
+# Initialize sampling profiler for /debug/profile
+profiler = SamplingProfiler(max_seconds=60)
+if ENABLE_PROFILER:
+    logger.info("Sampling profiler endpoint enabled")
+if ADMIN_TOKEN:
+    logger.info("Admin API enabled")
+
+# Last cache invalidation applied to the memory cache of this worker
+_last_invalidation_id = disk_cache.get_invalidations()[0] if disk_cache else 0
+_last_invalidation_check = 0.0
+
+# Keep references to background tasks so they aren't garbage collected
+_background_tasks = set()
+
+# Set once the image processing modules are imported by the warm-up task
+_image_modules_loaded = False
+# Set once the warm-up task has loaded the index and refreshed it if it was stale
+_index_warmed_up = False
+
+def start_background_task(coroutine) -> asyncio.Task:
+    """
+    Run a coroutine in the background of this worker.
+
+    Args:
+        coroutine: Coroutine to run
+
+    Returns:
+        The running task
+    """
+    task = asyncio.create_task(coroutine)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def refresh_library_index_in_background():
+    """
+    Refresh the library index without blocking requests, keeping the old index on failure.
+    Images that were modified or deleted in Nextcloud are removed from the caches.
+    """
     try:
-        all_images = []
-        for folder in NEXTCLOUD_DIRS:
-            logger.info(f"Scanning Nextcloud folder: {folder}")
-            images = nextcloud_client.list_pictures(folder.strip())
-            logger.info(f"Found {len(images)} images in {folder}")
-            all_images.extend(images)
-        logger.info(f"Total Nextcloud images loaded: {len(all_images)}")
-        return all_images
+        with fetch_priority(BACKGROUND):
+            changed = await asyncio.to_thread(library_index.refresh)
     except Exception as e:
-        logger.error(f"Error fetching Nextcloud images: {str(e)}")
-        return []
+        # Already logged by the index, the old index stays in use
+        logger.debug(f"Background refresh of library index failed: {e}")
+        return
+    invalidated = await invalidate_cached_images(changed)
+    if invalidated:
+        logger.info(f"Removed the cached versions of {len(changed)} modified or deleted images")
 
-async def update_image_list():
-    """Update the global list of all available images."""
-    global _all_images
-    _all_images = await get_nextcloud_images()
-    logger.info(f"Updated total images available: {len(_all_images)}")
+async def invalidate_cached_images(prefixes: List[str]) -> int:
+    """
+    Remove processed images from the memory cache of this worker and from the shared disk cache.
+    The other workers drop them from their memory caches within INVALIDATION_CHECK_INTERVAL seconds.
+
+    Args:
+        prefixes: Path prefixes of the images to remove, e.g. image paths or a folder
+
+    Returns:
+        Number of removed cache entries
+    """
+    if not prefixes:
+        return 0
+    removed = image_cache.invalidate(prefixes)
+    if disk_cache:
+        removed += await asyncio.to_thread(disk_cache.invalidate, prefixes)
+    return removed
+
+async def apply_cache_invalidations():
+    """Drop the images invalidated by another worker process from the memory cache."""
+    global _last_invalidation_id, _last_invalidation_check
+    if not disk_cache or time.time() - _last_invalidation_check < INVALIDATION_CHECK_INTERVAL:
+        return
+    _last_invalidation_check = time.time()
+    _last_invalidation_id, prefixes = await asyncio.to_thread(disk_cache.get_invalidations, _last_invalidation_id)
+    if prefixes:
+        image_cache.invalidate(prefixes)
+
+async def ensure_library_index(wait: bool = True):
+    """
+    Make sure the library index is loaded.
+    Only blocks if there is no persisted index yet; a stale index keeps being served
+    while it is refreshed in the background.
+
+    Args:
+        wait: Wait for the first scan if there is no index yet (otherwise it runs in the background)
+    """
+    # Pick up an index refreshed and images invalidated by another worker process.
+    # Before the first load, the persisted index is loaded right away, even if it is stale
+    await asyncio.to_thread(library_index.reload_if_changed, library_index.last_sync is None)
+    await apply_cache_invalidations()
+    if library_index.last_sync is None and wait:
+        # Joins the scan started by the warm-up task instead of scanning again
+        await asyncio.to_thread(library_index.refresh)
+    elif (_index_warmed_up and library_index.needs_refresh() and not library_index.is_refreshing()
+          and nextcloud_client.circuit_breaker.is_available()):
+        # Until then, the warm-up task refreshes a stale index
+        start_background_task(refresh_library_index_in_background())
+
+def probe_image_metadata(image_path: str) -> Dict:
+    """
+    Read the dimensions of an image from the beginning of the file. Blocking.
+
+    Args:
+        image_path: Path to the image in Nextcloud
+
+    Returns:
+        Metadata fields for the index
+    """
+    from image_utils import read_image_info
+
+    # The header usually fits in the first 64 KB, large EXIF blocks need more
+    for max_bytes in (64 * 1024, 512 * 1024):
+        header = nextcloud_client.get_image(image_path, max_bytes=max_bytes)
+        info = read_image_info(header)
+        if info:
+            return info
+        if len(header) < max_bytes:
+            break
+    return {"metadata_failed": True}
+
+async def crawl_metadata():
+    """
+    Probe the dimensions of indexed images in the background, for aspect ratio aware selection.
+    Only one worker process crawls at a time.
+    """
+    while True:
+        try:
+            await ensure_library_index()
+            pending = library_index.get_images_without_metadata(limit=50)
+            if not pending or not library_index.try_lock_crawler():
+                await asyncio.sleep(60)
+                continue
+
+            updates = {}
+            for image in pending:
+                if not nextcloud_client.circuit_breaker.is_available():
+                    break
+                try:
+                    with fetch_priority(BACKGROUND):
+                        updates[image["path"]] = await asyncio.to_thread(probe_image_metadata, image["path"])
+                except Exception as e:
+                    logger.debug(f"Failed to probe {image['path']}: {e}")
+                    updates[image["path"]] = {"metadata_failed": True}
+                # Leave room for interactive requests
+                await asyncio.sleep(0.1)
+            await asyncio.to_thread(library_index.set_metadata, updates)
+            logger.debug(f"Probed metadata of {len(updates)} images")
+            if not updates:
+                await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Metadata crawl failed: {e}")
+            await asyncio.sleep(60)
+
+def load_image_modules() -> None:
+    """Import the image processing modules (Pillow, piexif, pillow-heif). Blocking, slow on small devices."""
+    global _image_modules_loaded
+    import image_utils  # noqa: F401
+    import embedded_preview  # noqa: F401
+    _image_modules_loaded = True
+
+async def warm_up():
+    """
+    Prepare this worker after startup without delaying it: import the image processing modules,
+    load the persisted library index and scan Nextcloud if there is no index yet or it is stale.
+    Cached images are served meanwhile.
+    """
+    global _index_warmed_up
+    start = time.perf_counter()
+    try:
+        await asyncio.to_thread(load_image_modules)
+        await asyncio.to_thread(library_index.reload_if_changed, True)
+        if library_index.needs_refresh():
+            await refresh_library_index_in_background()
+    except Exception as e:
+        logger.error(f"Warm-up failed: {e}")
+    finally:
+        _index_warmed_up = True
+    if get_readiness()["ready"]:
+        logger.info(f"Worker ready after {time.perf_counter() - start:.2f}s")
+
+    if METADATA_CRAWL:
+        start_background_task(crawl_metadata())
+
+@app.on_event("startup")
+async def start_background_tasks():
+    """Start the background tasks of this worker. Startup doesn't wait for them."""
+    start_background_task(warm_up())
+
+def get_health() -> Dict:
+    """
+    Get the health of the service and its dependencies.
+
+    Returns:
+        Dictionary with overall status ("healthy" or "degraded"), Nextcloud circuit state and index state
+    """
+    nextcloud_state = nextcloud_client.circuit_breaker.get_state()
+    index_state = library_index.get_state()
+    degraded = nextcloud_state["state"] != "closed" or index_state["last_error"] is not None
+    return {
+        "status": "degraded" if degraded else "healthy",
+        "nextcloud": nextcloud_state,
+        "index": index_state
+    }
+
+def get_readiness() -> Dict:
+    """
+    Check whether this worker has finished its warm-up.
+
+    Returns:
+        Dictionary with "ready" and the state of each warm-up step
+    """
+    checks = {
+        "image_modules": _image_modules_loaded,
+        "library_index": library_index.last_sync is not None
+    }
+    return {"ready": all(checks.values()), **checks}
 
 @app.get("/", response_class=HTMLResponse)
 async def status_page():
     """Serve the status page."""
     try:
-        images = nextcloud_client.list_pictures()
+        try:
+            # Show the page right away after a restart, the first scan continues in the background
+            await ensure_library_index(wait=False)
+        except Exception as e:
+            logger.warning(f"Showing status page without library index: {e}")
         cache_stats = image_cache.get_stats()
         return HTMLResponse(generate_status_page(
-            images=images,
+            library_summary=library_index.get_summary(),
             nextcloud_url=NEXTCLOUD_URL,
             nextcloud_username=NEXTCLOUD_USERNAME,
             nextcloud_dirs=NEXTCLOUD_DIRS,
             max_image_size=MAX_IMAGE_SIZE,
+            allow_upscale=ALLOW_UPSCALE,
             jpg_quality=JPG_QUALITY,
             convert_to_jpg=CONVERT_TO_JPG,
             crop_portrait_to_square=CROP_PORTRAIT_TO_SQUARE,
             cache_stats=cache_stats,
-            debug_logging=DEBUG_LOGGING
+            disk_cache_stats=await asyncio.to_thread(disk_cache.get_stats) if disk_cache else None,
+            worker_info={"pid": os.getpid(), "workers": WORKERS},
+            admission_stats=admission_controller.get_stats(),
+            fetch_stats=nextcloud_client.scheduler.get_stats(),
+            health=get_health(),
+            debug_logging=DEBUG_LOGGING,
+            slow_requests=slow_request_log.get_entries()
         ))
     except Exception as e:
         logger.error(f"Error generating status page: {e}")
         raise HTTPException(status_code=500, detail="Error generating status page")
 
-async def get_processed_image(image_path: str) -> Tuple[bytes, str]:
+@app.get("/api/images")
+async def list_images(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    sort: str = "name",
+    order: str = "asc"
+):
     """
-    Get a processed image, either from cache or by processing it.
+    Get a page of the indexed images.
+
+    Args:
+        offset: Index of the first image to return
+        limit: Maximum number of images to return
+        sort: Key to sort by (name, path, folder, size or modified)
+        order: Sort order (asc or desc)
+    """
+    try:
+        await ensure_library_index()
+    except Exception as e:
+        logger.error(f"Error refreshing library index: {e}")
+        raise HTTPException(status_code=500, detail="Error refreshing library index")
+
+    try:
+        return library_index.get_page(offset=offset, limit=limit, sort=sort, order=order)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def get_content_type(image_path: str) -> str:
+    """
+    Get the content type of a processed image.
 
     Args:
         image_path: Path to the image in Nextcloud
 
     Returns:
-        Tuple of (processed_image_data, content_type)
+        Content type of the processed image
     """
-    # Try to get from cache first
-    cached = image_cache.get(image_path)
-    if cached:
-        logger.debug(f"Cache hit for image: {image_path}")
-        return cached
+    # Determine content type from original file extension
+    ext = image_path.lower().split('.')[-1]
+    if ext == 'gif' and GIF_MODE == "animated":
+        return "image/webp"
+    if ext in ('heic', 'heif', 'avif'):
+        # Always converted, browsers can't display them reliably
+        return "image/jpeg"
+
+    if CONVERT_TO_JPG:
+        return "image/jpeg"
+
+    content_type_map = {
+        'png': 'image/png',
+        'jpg': 'image/jpeg',
+        'jpeg': 'image/jpeg',
+        'gif': 'image/gif',
+        'webp': 'image/webp',
+        'bmp': 'image/bmp'
+    }
+    return content_type_map.get(ext, 'application/octet-stream')
+
+@functools.lru_cache(maxsize=1)
+def get_render_fingerprint() -> str:
+    """
+    Get a fingerprint of every setting that affects processed images.
+    It is part of the cache keys, so after a configuration change the disk cache
+    misses the old renders instead of serving them.
+
+    Returns:
+        Short hex digest of the settings
+    """
+    import jpeg_lossless
+    from image_utils import VERTICAL_CROP_BIAS, HEIF_SUPPORT
+
+    settings = {
+        "max_image_size": MAX_IMAGE_SIZE,
+        "jpg_quality": JPG_QUALITY,
+        "convert_to_jpg": str(CONVERT_TO_JPG).lower(),
+        "crop_portrait_to_square": str(CROP_PORTRAIT_TO_SQUARE).lower(),
+        "crop_bias": VERTICAL_CROP_BIAS,
+        "allow_upscale": ALLOW_UPSCALE,
+        "lossless_jpeg": LOSSLESS_JPEG and jpeg_lossless.is_available(),
+        "gif_mode": GIF_MODE,
+        "max_gif_size_mb": MAX_GIF_SIZE_MB,
+        "max_gif_frames": MAX_GIF_FRAMES,
+        "max_animation_size_mb": MAX_ANIMATION_SIZE_MB,
+        "heif_previews": HEIF_PREVIEWS,
+        "heif_support": HEIF_SUPPORT,
+        "embedded_previews": EMBEDDED_PREVIEWS
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+def get_cache_key(
+    image_path: str,
+    target_aspect: Optional[float] = None,
+    pair_path: Optional[str] = None,
+    size: Optional[int] = None
+) -> str:
+    """
+    Get the cache key of a processed image variant.
+    Keys start with the image path, so all variants of an image share its path as prefix,
+    and end with the fingerprint of the processing settings.
+
+    Args:
+        image_path: Path to the image in Nextcloud
+        target_aspect: Aspect ratio the image is cropped to
+        pair_path: Path of the portrait shown next to the image
+        size: Maximum width/height if smaller than MAX_IMAGE_SIZE
+
+    Returns:
+        Cache key
+    """
+    key = image_path
+    if pair_path:
+        key += f"+{pair_path}"
+    if target_aspect:
+        key += f"|aspect={target_aspect:.3f}"
+    if size:
+        key += f"|size={size}"
+    return key + f"|render={get_render_fingerprint()}"
+
+def download_image(image_path: str, timer=NULL_TIMER) -> bytes:
+    """
+    Download an image and record its header metadata in the index if missing.
+    GIFs are only downloaded up to MAX_GIF_SIZE_MB, the frames after that are dropped.
+    For HEIC/HEIF and AVIF images the preview rendered by Nextcloud is used if available,
+    so they don't have to be decoded here.
+
+    Args:
+        image_path: Path to the image in Nextcloud
+        timer: RequestTimer collecting the duration of each stage
+
+    Returns:
+        Image data
+    """
+    from image_utils import read_image_info, HEIF_SUPPORT
+
+    if HEIF_PREVIEWS and image_path.lower().endswith(PREVIEW_EXTENSIONS):
+        try:
+            with timer.stage("download"):
+                return nextcloud_client.get_preview(image_path, MAX_IMAGE_SIZE)
+        except PreviewNotAvailableError:
+            if not HEIF_SUPPORT:
+                raise
+            logger.debug(f"Decoding {image_path} locally, Nextcloud has no preview")
+
+    max_bytes = int(MAX_GIF_SIZE_MB * 1024 * 1024) if image_path.lower().endswith(".gif") else None
+    with timer.stage("download"):
+        image_data = nextcloud_client.get_image(image_path, max_bytes=max_bytes)
+    if max_bytes and len(image_data) >= max_bytes:
+        logger.info(f"Only using the first {MAX_GIF_SIZE_MB:g} MB of {image_path}")
+    image = library_index.get_image(image_path)
+    if image is not None and "width" not in image:
+        # Parsing the header is cheap compared to probing the image again later
+        info = read_image_info(image_data)
+        library_index.set_metadata({image_path: info or {"metadata_failed": True}})
+    return image_data
+
+def fetch_embedded_preview(
+    image_path: str,
+    size: int,
+    timer=NULL_TIMER,
+    target_aspect: Optional[float] = None
+) -> Optional[bytes]:
+    """
+    Create a small image from a preview embedded in a JPEG, without downloading the whole file.
+    Only the header and, for MPF previews, the preview itself are fetched with range requests.
+
+    Args:
+        image_path: Path to the image in Nextcloud
+        size: Maximum width/height of the output
+        timer: RequestTimer collecting the duration of each stage
+        target_aspect: Aspect ratio to crop the image to
+
+    Returns:
+        Processed image data, None if there is no embedded preview large enough
+    """
+    from embedded_preview import find_previews, get_preview_orientation, HEADER_BYTES
+    from image_utils import process_embedded_preview
+
+    with timer.stage("download"):
+        header = nextcloud_client.get_image(image_path, max_bytes=HEADER_BYTES)
+    orientation, previews = find_previews(header)
+    for preview in previews:
+        if preview.get("long_edge") and preview["long_edge"] < size:
+            continue
+        preview_data = preview.get("data")
+        if preview_data is None:
+            with timer.stage("download"):
+                preview_data = nextcloud_client.get_image(
+                    image_path, max_bytes=preview["length"], offset=preview["offset"]
+                )
+        processed_data = process_embedded_preview(
+            preview_data,
+            orientation=get_preview_orientation(preview_data, orientation),
+            size=size,
+            quality=JPG_QUALITY,
+            crop_portrait_to_square=CROP_PORTRAIT_TO_SQUARE,
+            target_aspect=target_aspect,
+            timer=timer
+        )
+        if processed_data:
+            return processed_data
+    return None
+
+def fetch_and_process_image(
+    image_path: str,
+    timer=NULL_TIMER,
+    target_aspect: Optional[float] = None,
+    pair_path: Optional[str] = None,
+    size: Optional[int] = None
+) -> bytes:
+    """
+    Download an image from Nextcloud and process it. Blocking, runs in a worker thread.
+    Small JPEGs are created from an embedded preview if the image has one that is large enough.
 
-    logger.debug(f"Cache miss for image: {image_path}")
-    # Fetch and process image
-    image_data = nextcloud_client.get_image(image_path)
+    Args:
+        image_path: Path to the image in Nextcloud
+        timer: RequestTimer collecting the duration of each stage
+        target_aspect: Aspect ratio to crop the image to
+        pair_path: Path of a portrait to show next to the image
+        size: Maximum width/height if smaller than MAX_IMAGE_SIZE
+
+    Returns:
+        Processed image data
+    """
+    from image_utils import process_image, process_image_pair
+
+    max_size = size or MAX_IMAGE_SIZE
+    if pair_path:
+        return process_image_pair(
+            image_data_pair=[download_image(image_path, timer), download_image(pair_path, timer)],
+            max_size=max_size,
+            target_aspect=target_aspect,
+            quality=JPG_QUALITY,
+            timer=timer
+        )
+
+    if size and EMBEDDED_PREVIEWS and image_path.lower().endswith(('.jpg', '.jpeg')):
+        try:
+            processed_data = fetch_embedded_preview(image_path, size, timer, target_aspect)
+            if processed_data:
+                return processed_data
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.debug(f"Could not use embedded preview of {image_path}: {e}")
+
+    image_data = download_image(image_path, timer)
     processed_data = process_image(
         image_data=image_data,
-        max_size=MAX_IMAGE_SIZE,
+        max_size=max_size,
         quality=JPG_QUALITY,
-        convert_to_jpg=CONVERT_TO_JPG,
-        crop_portrait_to_square=CROP_PORTRAIT_TO_SQUARE
+        # HEIC/HEIF and AVIF are served as JPG, also when Nextcloud rendered a PNG preview of them
+        convert_to_jpg=CONVERT_TO_JPG or image_path.lower().endswith(PREVIEW_EXTENSIONS),
+        crop_portrait_to_square=CROP_PORTRAIT_TO_SQUARE,
+        target_aspect=target_aspect,
+        allow_upscale=ALLOW_UPSCALE,
+        lossless=LOSSLESS_JPEG,
+        animate=GIF_MODE == "animated",
+        max_frames=MAX_GIF_FRAMES,
+        max_animation_bytes=int(MAX_ANIMATION_SIZE_MB * 1024 * 1024),
+        timer=timer
     )
+    if not target_aspect:
+        with timer.stage("hash"):
+            record_phash(image_path, processed_data)
+    return processed_data
+
+def record_phash(image_path: str, processed_data: bytes) -> None:
+    """
+    Store the perceptual hash of an image in the index to find copies of it. Blocking.
+    Only uncropped images are hashed, so the hash doesn't depend on the display.
+
+    Args:
+        image_path: Path to the image in Nextcloud
+        processed_data: Processed image data
+    """
+    from image_utils import compute_phash
+
+    image = library_index.get_image(image_path)
+    if image is None or "phash" in image:
+        return
+    phash = compute_phash(processed_data)
+    library_index.set_metadata({image_path: {"phash": phash}})
+    canonical_path = library_index.get_canonical_path(image_path)
+    if canonical_path != image_path:
+        logger.info(f"{image_path} is a copy of {canonical_path}")
+
+def load_or_process_image(
+    image_path: str,
+    timer=NULL_TIMER,
+    target_aspect: Optional[float] = None,
+    pair_path: Optional[str] = None,
+    size: Optional[int] = None
+) -> Tuple[Union[bytes, memoryview], str]:
+    """
+    Get a processed image from the disk cache or process it. Blocking, runs in a worker thread.
+    Holds the file lock of the image, so each image is only processed once across all workers.
+
+    Args:
+        image_path: Path to the image in Nextcloud
+        timer: RequestTimer collecting the duration of each stage
+        target_aspect: Aspect ratio to crop the image to
+        pair_path: Path of a portrait to show next to the image
+        size: Maximum width/height if smaller than MAX_IMAGE_SIZE
+
+    Returns:
+        Tuple of (processed_image_data, content_type)
+    """
+    cache_key = get_cache_key(image_path, target_aspect, pair_path, size)
+    content_type = "image/jpeg" if pair_path else get_content_type(image_path)
+    if not disk_cache:
+        return fetch_and_process_image(image_path, timer, target_aspect, pair_path, size), content_type
+
+    with disk_cache.lock(cache_key):
+        # Another worker may have processed the image while we waited for the lock
+        cached = disk_cache.get(cache_key, mapped=MMAP_CACHE)
+        if cached:
+            return cached
+
+        processed_data = fetch_and_process_image(image_path, timer, target_aspect, pair_path, size)
+        disk_cache.put(cache_key, processed_data, content_type)
+        if MMAP_CACHE:
+            # Keep the mapped file instead of the processed copy, unless it was evicted right away
+            return disk_cache.get(cache_key, mapped=True) or (processed_data, content_type)
+        return processed_data, content_type
+
+async def get_processed_image(
+    image_path: str,
+    timer=NULL_TIMER,
+    target_aspect: Optional[float] = None,
+    pair_path: Optional[str] = None,
+    size: Optional[int] = None
+) -> Tuple[Union[bytes, memoryview], str]:
+    """
+    Get a processed image, either from cache or by processing it.
+    Images are looked up in the in-memory cache of this worker, then in the disk cache
+    shared by all workers. Cache misses go through admission control, so only a limited
+    number of images are downloaded and processed at the same time.
+
+    Args:
+        image_path: Path to the image in Nextcloud
+        timer: RequestTimer collecting the duration of each stage
+        target_aspect: Aspect ratio to crop the image to (None to keep the aspect ratio)
+        pair_path: Path of a portrait to show next to the image (requires target_aspect)
+        size: Maximum width/height if smaller than MAX_IMAGE_SIZE
+
+    Returns:
+        Tuple of (processed_image_data, content_type), the data is a memoryview of the
+        mapped disk cache file if mmap_cache is enabled
+
+    Raises:
+        AdmissionRejectedError: If the processing queue is full
+    """
+    # Copies of a picture share the cache entries of the image representing them
+    image_path = library_index.get_canonical_path(image_path)
+    if pair_path:
+        pair_path = library_index.get_canonical_path(pair_path)
+    cache_key = get_cache_key(image_path, target_aspect, pair_path, size)
+
+    # Try to get from cache first
+    with timer.stage("cache"):
+        cached = image_cache.get(cache_key)
+    if cached:
+        logger.debug(f"Cache hit for image: {cache_key}")
+        return cached
+
+    if disk_cache:
+        with timer.stage("disk"):
+            cached = await asyncio.to_thread(disk_cache.get, cache_key, MMAP_CACHE)
+        if cached:
+            logger.debug(f"Disk cache hit for image: {cache_key}")
+            image_cache.put(cache_key, *cached)
+            return cached
+
+    logger.debug(f"Cache miss for image: {cache_key}")
+    async with admission_controller.slot(timer):
+        # Another request may have processed the image while we were waiting
+        cached = image_cache.peek(cache_key)
+        if cached:
+            return cached
+
+        # Fetch and process image outside the event loop
+        processed_data, content_type = await asyncio.to_thread(
+            load_or_process_image, image_path, timer, target_aspect, pair_path, size
+        )
 
     # Store in cache
-    if CONVERT_TO_JPG:
-        content_type = "image/jpeg"
-    else:
-        # Determine content type from original file extension
-        ext = image_path.lower().split('.')[-1]
-        content_type_map = {
-            'png': 'image/png',
-            'jpg': 'image/jpeg',
-            'jpeg': 'image/jpeg',
-            'gif': 'image/gif',
-            'webp': 'image/webp',
-            'bmp': 'image/bmp'
-        }
-        content_type = content_type_map.get(ext, 'application/octet-stream')
-    image_cache.put(image_path, processed_data, content_type)
+    image_cache.put(cache_key, processed_data, content_type)
 
     return processed_data, content_type
 
+class ImageResponse(Response):
+    """Response that sends memory-mapped images without copying them into a bytes object."""
+    def render(self, content) -> Union[bytes, memoryview]:
+        if isinstance(content, memoryview):
+            return content
+        return super().render(content)
+
+def image_response(processed_data: Union[bytes, memoryview], content_type: str, timer) -> Response:
+    """
+    Build the response for a processed image and record its timing.
+
+    Args:
+        processed_data: Processed image data
+        content_type: Content type of the image
+        timer: RequestTimer of the request
+
+    Returns:
+        Response with a Server-Timing header if timing is enabled
+    """
+    headers = {}
+    if SERVER_TIMING:
+        headers["Server-Timing"] = timer.server_timing_header()
+        slow_request_log.record(timer)
+    return ImageResponse(
+        content=processed_data,
+        media_type=content_type,
+        headers=headers
+    )
+
+def service_unavailable() -> HTTPException:
+    """
+    Build the error returned when an image can't be processed due to overload
+    or because Nextcloud is unavailable.
+
+    Returns:
+        HTTPException with status 503 and a Retry-After header
+    """
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy, try again later",
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+    )
+
+def parse_aspect(aspect: Optional[str]) -> Optional[float]:
+    """
+    Parse a target aspect ratio given as "16:9", "16x9" or "1.78".
+
+    Args:
+        aspect: Aspect ratio query parameter
+
+    Returns:
+        Width / height ratio rounded to 3 decimals, None if no aspect ratio was given
+
+    Raises:
+        HTTPException: If the aspect ratio is invalid
+    """
+    if not aspect:
+        return None
+    try:
+        for separator in (":", "x"):
+            if separator in aspect:
+                width, height = aspect.split(separator, 1)
+                value = float(width) / float(height)
+                break
+        else:
+            value = float(aspect)
+    except (ValueError, ZeroDivisionError):
+        raise HTTPException(status_code=400, detail=f"Invalid aspect ratio: {aspect}")
+    if not 0.2 <= value <= 5:
+        raise HTTPException(status_code=400, detail=f"Aspect ratio out of range: {aspect}")
+    return round(value, 3)
+
+def parse_size(size: Optional[int]) -> Optional[int]:
+    """
+    Parse the requested maximum width/height of the image.
+
+    Args:
+        size: Size query parameter
+
+    Returns:
+        Requested size, None if no size was given or it isn't smaller than MAX_IMAGE_SIZE
+
+    Raises:
+        HTTPException: If the size is invalid
+    """
+    if size is None:
+        return None
+    if size < 16:
+        raise HTTPException(status_code=400, detail=f"Size out of range: {size}")
+    return size if size < MAX_IMAGE_SIZE else None
+
+def select_random_image(
+    images: List[Dict],
+    target_aspect: Optional[float],
+    pair_portraits: bool,
+    rng: Optional[random.Random] = None
+) -> Tuple[Dict, Optional[Dict]]:
+    """
+    Select a random image, preferring images that match the aspect ratio of the display.
+    If portraits are paired, pairs of portraits are candidates for landscape displays too.
+
+    Args:
+        images: All indexed images, one per picture
+        target_aspect: Aspect ratio of the display (None for any image)
+        pair_portraits: Whether to show two portraits side by side on landscape displays
+        rng: Random generator to use (e.g. seeded, so all workers select the same image)
+
+    Returns:
+        Tuple of (selected image, portrait partner or None)
+    """
+    rng = rng or random
+    if not target_aspect:
+        return rng.choice(images), None
+
+    candidates = library_index.get_images_for_aspect(target_aspect)
+    pairing = pair_portraits and target_aspect >= 1
+    if pairing:
+        candidates = candidates + library_index.get_portrait_pairs()
+    if not candidates:
+        # Dimensions not probed yet or no matching images, fall back to any image
+        candidates = images
+
+    selected_image = rng.choice(candidates)
+    if pairing and library_index.is_portrait(selected_image):
+        return selected_image, library_index.get_portrait_partner(selected_image)
+    return selected_image, None
+
 @app.get("/random")
-async def get_random_image():
-    """Get a random image from Nextcloud."""
+async def get_random_image(aspect: Optional[str] = None, pair: Optional[bool] = None, size: Optional[int] = None):
+    """
+    Get a random image from Nextcloud.
+
+    Args:
+        aspect: Aspect ratio of the display (e.g. "16:9"); matching images are preferred and cropped to fill it
+        pair: Show two portraits side by side on landscape displays (defaults to the pair_portraits option)
+        size: Maximum width/height of the image if smaller than max_image_size (e.g. for small tiles)
+    """
     try:
-        images = nextcloud_client.list_pictures()
+        timer = start_timer("/random", SERVER_TIMING)
+        target_aspect = parse_aspect(aspect)
+        size = parse_size(size)
+        with timer.stage("list"):
+            await ensure_library_index()
+            images = library_index.get_unique_images()
         if not images:
             raise HTTPException(status_code=404, detail="No images found")
 
-        selected_image = random.choice(images)
-        logger.info(f"Selected random image: {selected_image['name']}")
+        selected_image, partner_image = select_random_image(
+            images, target_aspect, PAIR_PORTRAITS if pair is None else pair
+        )
+        pair_path = partner_image["path"] if partner_image else None
+        logger.info(f"Selected random image: {selected_image['name']}" + (f" with {partner_image['name']}" if partner_image else ""))
+        timer.name = get_cache_key(selected_image["path"], target_aspect, pair_path, size)
 
         # Get processed image
-        processed_data, content_type = await get_processed_image(selected_image["path"])
+        try:
+            processed_data, content_type = await get_processed_image(selected_image["path"], timer, target_aspect, pair_path, size)
+        except Exception as e:
+            # Overloaded or Nextcloud unavailable, keep slideshows going with an image that is already cached.
+            # Other errors (e.g. a broken file) are reported, they would hide bugs otherwise
+            if not isinstance(e, AdmissionRejectedError) and not is_unavailable_error(e):
+                raise
+            cached = image_cache.get_random()
+            if not cached:
+                raise
+            logger.warning(f"Serving a cached image instead of {selected_image['name']}: {e}")
+            processed_data, content_type = cached
 
-        return Response(
-            content=processed_data,
-            media_type=content_type
-        )
+        return image_response(processed_data, content_type, timer)
+    except HTTPException:
+        raise
+    except (AdmissionRejectedError, CircuitOpenError):
+        raise service_unavailable()
     except Exception as e:
         traceback.print_exc()
         logger.error(f"Error fetching random image: {e}")
         raise HTTPException(status_code=500, detail="Error fetching image")
 
 @app.get("/next")
-async def get_next_image():
-    """Get the next image in sequence."""
+async def get_next_image(aspect: Optional[str] = None, size: Optional[int] = None):
+    """
+    Get the next image in sequence.
+
+    Args:
+        aspect: Aspect ratio of the display (e.g. "16:9") to crop the image to
+        size: Maximum width/height of the image if smaller than max_image_size
+    """
     try:
-        images = nextcloud_client.list_pictures()
+        timer = start_timer("/next", SERVER_TIMING)
+        target_aspect = parse_aspect(aspect)
+        size = parse_size(size)
+        with timer.stage("list"):
+            await ensure_library_index()
+            images = library_index.get_unique_images()
         if not images:
             raise HTTPException(status_code=404, detail="No images found")
 
         # Get the next image (implementation depends on your sequence logic)
         selected_image = images[0]  # For now, just get the first image
         logger.info(f"Selected next image: {selected_image['name']}")
+        timer.name = get_cache_key(selected_image["path"], target_aspect, size=size)
 
         # Get processed image
-        processed_data, content_type = await get_processed_image(selected_image["path"])
+        processed_data, content_type = await get_processed_image(selected_image["path"], timer, target_aspect, size=size)
 
-        return Response(
-            content=processed_data,
-            media_type=content_type
-        )
+        return image_response(processed_data, content_type, timer)
+    except HTTPException:
+        raise
+    except (AdmissionRejectedError, CircuitOpenError):
+        raise service_unavailable()
     except Exception as e:
         traceback.print_exc()
         logger.error(f"Error fetching next image: {e}")
         raise HTTPException(status_code=500, detail="Error fetching image")
 
+def get_image_url(
+    image_path: str,
+    target_aspect: Optional[float] = None,
+    pair_path: Optional[str] = None,
+    size: Optional[int] = None
+) -> str:
+    """
+    Get the stable URL of a processed image variant.
+
+    Args:
+        image_path: Path to the image in Nextcloud
+        target_aspect: Aspect ratio the image is cropped to
+        pair_path: Path of the portrait shown next to the image
+        size: Maximum width/height if smaller than MAX_IMAGE_SIZE
+
+    Returns:
+        URL of the /image endpoint
+    """
+    params = {"path": image_path}
+    if target_aspect:
+        params["aspect"] = f"{target_aspect:.3f}"
+    if pair_path:
+        params["pair"] = pair_path
+    if size:
+        params["size"] = size
+    return f"/image?{urlencode(params)}"
+
+async def select_slide(params: Dict, rng: random.Random) -> Dict:
+    """
+    Select the next slide of a slideshow room.
+
+    Args:
+        params: Display parameters of the room (aspect, pair)
+        rng: Random generator seeded with the room and the slot
+
+    Returns:
+        Slide with the parameters needed to render it, for displays of any size
+    """
+    await ensure_library_index()
+    images = library_index.get_unique_images()
+    if not images:
+        raise ValueError("No images found")
+    selected_image, partner_image = select_random_image(images, params["aspect"], params["pair"], rng)
+    pair_path = partner_image["path"] if partner_image else None
+    return {
+        "name": selected_image["name"],
+        "path": selected_image["path"],
+        "pair": pair_path,
+        "aspect": params["aspect"]
+    }
+
+async def prepare_slide(slide: Dict, size: Optional[int]) -> None:
+    """
+    Render a slide into the cache before it is announced.
+
+    Args:
+        slide: Slide as returned by select_slide
+        size: Image size of displays in the room
+    """
+    with fetch_priority(PREFETCH):
+        await get_processed_image(slide["path"], NULL_TIMER, slide["aspect"], slide["pair"], size)
+
+def get_slide_url(slide: Dict, size: Optional[int]) -> str:
+    """
+    Get the stable URL of a slide for a display.
+
+    Args:
+        slide: Slide as returned by select_slide
+        size: Image size of the display
+
+    Returns:
+        URL of the image
+    """
+    return get_image_url(slide["path"], slide["aspect"], slide["pair"], size)
+
+# Announces the slides of each room to the slideshow displays
+slideshow_scheduler = SlideshowScheduler(
+    select_slide,
+    prepare_slide,
+    get_slide_url,
+    interval=SLIDESHOW_INTERVAL,
+    lead_time=SLIDESHOW_LEAD_TIME,
+    max_lookahead=SLIDESHOW_MAX_LOOKAHEAD
+)
+
+def parse_interval(interval: Optional[float]) -> Optional[float]:
+    """
+    Parse the requested slideshow interval.
+
+    Args:
+        interval: Interval query parameter in seconds
+
+    Returns:
+        Interval in seconds, None if no interval was given
+
+    Raises:
+        HTTPException: If the interval is out of range
+    """
+    if interval is None:
+        return None
+    if not 2 <= interval <= 3600:
+        raise HTTPException(status_code=400, detail=f"Interval out of range: {interval}")
+    return interval
+
+def get_room_params(aspect: Optional[str], pair: Optional[bool]) -> Dict:
+    """
+    Get the display parameters of a slideshow room from the query parameters.
+    Only parameters that affect the selection of the slides are included, so displays
+    of different sizes share a room.
+
+    Args:
+        aspect: Aspect ratio of the displays in the room
+        pair: Show two portraits side by side (None for the pair_portraits option)
+
+    Returns:
+        Dictionary with aspect and pair
+    """
+    return {
+        "aspect": parse_aspect(aspect),
+        "pair": PAIR_PORTRAITS if pair is None else pair
+    }
+
+@app.get("/image")
+async def get_image(path: str, aspect: Optional[str] = None, pair: Optional[str] = None, size: Optional[int] = None):
+    """
+    Get a specific image from the library under a stable URL, e.g. a slide announced to a room.
+
+    Args:
+        path: Path of the image in Nextcloud
+        aspect: Aspect ratio to crop the image to
+        pair: Path of a portrait to show next to the image (requires aspect)
+        size: Maximum width/height of the image if smaller than max_image_size
+    """
+    try:
+        timer = start_timer("/image", SERVER_TIMING)
+        target_aspect = parse_aspect(aspect)
+        size = parse_size(size)
+        if pair and not target_aspect:
+            raise HTTPException(status_code=400, detail="Pairs require an aspect ratio")
+        with timer.stage("list"):
+            await ensure_library_index()
+        # Only images in the library can be requested
+        if library_index.get_image(path) is None or (pair and library_index.get_image(pair) is None):
+            raise HTTPException(status_code=404, detail="Image not found")
+        timer.name = get_cache_key(path, target_aspect, pair, size)
+
+        processed_data, content_type = await get_processed_image(path, timer, target_aspect, pair, size)
+        response = image_response(processed_data, content_type, timer)
+        # The URL always returns the same image, so displays may cache it
+        response.headers["Cache-Control"] = "public, max-age=3600"
+        return response
+    except HTTPException:
+        raise
+    except (AdmissionRejectedError, CircuitOpenError):
+        raise service_unavailable()
+    except Exception as e:
+        traceback.print_exc()
+        logger.error(f"Error fetching image {path}: {e}")
+        raise HTTPException(status_code=500, detail="Error fetching image")
+
+@app.get("/events")
+async def slideshow_events(
+    room: str = "default",
+    aspect: Optional[str] = None,
+    pair: Optional[bool] = None,
+    size: Optional[int] = None,
+    interval: Optional[float] = None
+):
+    """
+    Server-sent events announcing the slides of a room ahead of time.
+    All displays in a room with the same aspect, pair and interval show the same slides
+    at the same time, each at its own size.
+
+    Args:
+        room: Name of the room
+        aspect: Aspect ratio of the displays in the room
+        pair: Show two portraits side by side on landscape displays (defaults to the pair_portraits option)
+        size: Maximum width/height of the images for this display if smaller than max_image_size
+        interval: Seconds each slide is shown (defaults to the slideshow_interval option)
+    """
+    params = get_room_params(aspect, pair)
+    return StreamingResponse(
+        slideshow_scheduler.subscribe(room, params, parse_interval(interval), parse_size(size)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/events/report", status_code=204)
+async def report_load_time(
+    load_ms: float,
+    room: str = "default",
+    aspect: Optional[str] = None,
+    pair: Optional[bool] = None,
+    interval: Optional[float] = None
+):
+    """
+    Report how long a display took to load and decode a slide.
+    The load times of a room determine how far ahead its slides are announced.
+
+    Args:
+        load_ms: Load time in milliseconds
+        room: Name of the room
+        aspect: Aspect ratio of the displays in the room
+        pair: Show two portraits side by side on landscape displays
+        interval: Seconds each slide is shown
+    """
+    if load_ms < 0:
+        raise HTTPException(status_code=400, detail=f"Invalid load time: {load_ms}")
+    params = get_room_params(aspect, pair)
+    slideshow_scheduler.record_load_time(room, params, parse_interval(interval), load_ms / 1000)
+    return Response(status_code=204)
+
 @app.get("/slideshow", response_class=HTMLResponse)
 async def slideshow():
     """Serve the slideshow page."""
-    return generate_slideshow_page()
+    return generate_slideshow_page(SLIDESHOW_INTERVAL)
+
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def debug_profile(seconds: float = 10, interval_ms: int = 10):
+    """
+    Profile the running process and return collapsed stacks for flamegraph tools.
+    With several workers, only the worker that received the request is profiled;
+    its process ID is returned in the X-Worker-PID header and the file name.
+
+    Args:
+        seconds: Duration of the profile (at most 60 seconds)
+        interval_ms: Time between two samples in milliseconds
+    """
+    if not ENABLE_PROFILER:
+        raise HTTPException(status_code=404, detail="Profiler is disabled")
+
+    try:
+        # Sample from a worker thread so the event loop keeps serving (and is profiled)
+        collapsed = await asyncio.to_thread(profiler.sample, seconds, max(interval_ms, 1) / 1000)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    pid = os.getpid()
+    return PlainTextResponse(
+        content=collapsed,
+        headers={
+            "Content-Disposition": f'attachment; filename="photo-proxy-{pid}.collapsed"',
+            "X-Worker-PID": str(pid),
+            "X-Workers": str(WORKERS)
+        }
+    )
+
+def require_admin(authorization: Optional[str] = Header(None)) -> None:
+    """
+    Check the bearer token of an admin API request.
+
+    Args:
+        authorization: Authorization header of the request
+
+    Raises:
+        HTTPException: 404 if the admin API is disabled, 401 if the token is missing or wrong
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin API is disabled")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.strip().encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+def get_folder_images(folder: str) -> List[Dict]:
+    """
+    Get the indexed images of a configured folder.
+
+    Args:
+        folder: Folder as configured in nextcloud_dirs
+
+    Returns:
+        List of image entries (empty if the folder is unknown or empty)
+    """
+    folder = folder.strip().strip("/")
+    return [image for image in library_index.get_images() if image["folder"].strip() == folder]
+
+def get_folder_prefix(folder: str) -> str:
+    """
+    Get the path prefix of the images in a folder, as used in the cache keys.
+
+    Args:
+        folder: Folder in Nextcloud, relative to the user's files
+
+    Returns:
+        Path prefix ending with a slash
+    """
+    images = get_folder_images(folder)
+    if images:
+        return posixpath.dirname(images[0]["path"]) + "/"
+    return quote(f"/remote.php/dav/files/{NEXTCLOUD_USERNAME}/{folder.strip().strip('/')}/")
+
+async def warm_images(image_paths: List[str], target_aspect: Optional[float], size: Optional[int]):
+    """
+    Process images into the cache one at a time, leaving the other processing slots to requests.
+
+    Args:
+        image_paths: Paths of the images to process
+        target_aspect: Aspect ratio to crop the images to
+        size: Maximum width/height if smaller than MAX_IMAGE_SIZE
+    """
+    start = time.perf_counter()
+    warmed = 0
+    for image_path in image_paths:
+        while True:
+            try:
+                with fetch_priority(PREFETCH):
+                    await get_processed_image(image_path, NULL_TIMER, target_aspect, None, size)
+                warmed += 1
+                break
+            except AdmissionRejectedError:
+                await asyncio.sleep(RETRY_AFTER_SECONDS)
+            except CircuitOpenError as e:
+                logger.warning(f"Stopped warming the cache after {warmed} images: {e}")
+                return
+            except Exception as e:
+                logger.warning(f"Failed to warm {image_path}: {e}")
+                break
+    logger.info(f"Warmed cache with {warmed} of {len(image_paths)} images in {time.perf_counter() - start:.1f}s")
+
+@app.post("/admin/resync", dependencies=[Depends(require_admin)])
+async def admin_resync(folder: Optional[str] = None):
+    """
+    Rescan the library, or only one folder, and remove modified and deleted images from the caches.
+
+    Args:
+        folder: Configured folder to rescan (None to rescan all folders)
+    """
+    try:
+        if folder:
+            changed = await asyncio.to_thread(library_index.refresh_folder, folder)
+        else:
+            changed = await asyncio.to_thread(library_index.refresh, True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CircuitOpenError:
+        raise service_unavailable()
+    except Exception as e:
+        logger.error(f"Admin resync failed: {e}")
+        raise HTTPException(status_code=502, detail="Failed to list the images in Nextcloud")
+
+    invalidated = await invalidate_cached_images(changed)
+    return {
+        "images": len(library_index.get_images()),
+        "changed": len(changed),
+        "invalidated": invalidated
+    }
+
+@app.post("/admin/invalidate", dependencies=[Depends(require_admin)])
+async def admin_invalidate(prefix: Optional[str] = None, folder: Optional[str] = None):
+    """
+    Remove processed images from the caches, without touching the rest of the cache.
+
+    Args:
+        prefix: Path prefix of the images, e.g. the path of an image
+        folder: Folder of the images, relative to the user's files
+    """
+    if bool(prefix) == bool(folder):
+        raise HTTPException(status_code=400, detail="Either prefix or folder is required")
+    if folder:
+        prefix = get_folder_prefix(folder)
+    invalidated = await invalidate_cached_images([prefix])
+    return {"prefix": prefix, "invalidated": invalidated}
+
+@app.post("/admin/warm", status_code=202, dependencies=[Depends(require_admin)])
+async def admin_warm(folder: str, aspect: Optional[str] = None, size: Optional[int] = None):
+    """
+    Process the images of a folder into the cache in the background.
+
+    Args:
+        folder: Configured folder to warm
+        aspect: Aspect ratio of the displays, only images selected for it are processed
+        size: Maximum width/height of the images if smaller than max_image_size
+    """
+    target_aspect = parse_aspect(aspect)
+    size = parse_size(size)
+    await ensure_library_index()
+    images = get_folder_images(folder)
+    if not images:
+        raise HTTPException(status_code=404, detail=f"No images in folder: {folder}")
+    if target_aspect:
+        matching = {image["path"] for image in library_index.get_images_for_aspect(target_aspect)}
+        images = [image for image in images if image["path"] in matching]
+
+    start_background_task(warm_images([image["path"] for image in images], target_aspect, size))
+    return JSONResponse(status_code=202, content={"folder": folder, "images": len(images)})
+
+@app.get("/admin/cache", dependencies=[Depends(require_admin)])
+async def admin_cache(limit: int = Query(1000, ge=1, le=100000)):
+    """
+    List the cached images and the cache sizes.
+
+    Args:
+        limit: Maximum number of entries listed per cache
+    """
+    return {
+        "memory": {**image_cache.get_stats(), "entries": image_cache.get_entries()[:limit]},
+        "disk": {
+            **disk_cache.get_stats(),
+            "entries": await asyncio.to_thread(disk_cache.get_entries, limit)
+        } if disk_cache else None
+    }
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
-    return {"status": "healthy"}
+    """Health check endpoint. Reports "degraded" while Nextcloud is unavailable and cached content is served."""
+    return get_health()
+
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness check, answered as long as the server is responsive. Doesn't depend on Nextcloud."""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness check, 503 until the worker has loaded the library index and the image processing modules."""
+    readiness = get_readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
 
 if __name__ == "__main__":
-    logger.info("Starting server...")
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8181)
\ No newline at end of file
+    if WORKERS > 1:
+        logger.info(f"Starting server with {WORKERS} workers...")
+        # Workers import the app themselves and share the index and disk cache in CACHE_DIR
+        uvicorn.run("main:app", host="0.0.0.0", port=8181, workers=WORKERS)
+    else:
+        logger.info("Starting server...")
+        uvicorn.run(app, host="0.0.0.0", port=8181)
\ No newline at end of file
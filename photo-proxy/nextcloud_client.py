@@ -1,13 +1,56 @@
-from webdav4.client import Client
 import logging
+import threading
 from typing import List, Dict, Optional
 import os
 import traceback
 from urllib.parse import quote, unquote
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from fetch_scheduler import FetchScheduler
 logger = logging.getLogger(__name__)
 
+# File extensions of the images that are listed
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.heic', '.heif', '.avif')
+
+# Bytes read at a time when downloading, transferred bytes are counted per chunk
+CHUNK_SIZE = 64 * 1024
+
+class PreviewNotAvailableError(Exception):
+    """Raised when Nextcloud can't render a preview of a file."""
+
+def is_unavailable_error(error: BaseException) -> bool:
+    """
+    Check whether an error means that Nextcloud is unavailable, as opposed to a problem
+    with a single file (e.g. not found or unreadable).
+
+    Args:
+        error: Exception raised by a Nextcloud request
+
+    Returns:
+        True for an open circuit, connection errors, timeouts and server errors
+    """
+    if isinstance(error, (CircuitOpenError, ConnectionError, TimeoutError)):
+        return True
+    # Imported here since the client is created lazily, an error from it means they are loaded
+    import httpx
+    from webdav4.client import BadGatewayError, HTTPError
+    if isinstance(error, (httpx.TransportError, BadGatewayError)):
+        return True
+    if isinstance(error, (HTTPError, httpx.HTTPStatusError)):
+        status_code = error.status_code if isinstance(error, HTTPError) else error.response.status_code
+        return status_code >= 500
+    return False
+
 class NextcloudClient:
-    def __init__(self, url: str, username: str, password: str, directories: List[str] = None):
+    def __init__(
+        self,
+        url: str,
+        username: str,
+        password: str,
+        directories: List[str] = None,
+        max_connections: int = 4,
+        max_bytes_per_second: float = 0,
+        max_requests_per_second: float = 0
+    ):
         """
         Initialize the Nextcloud client.
 
@@ -16,30 +59,56 @@ class NextcloudClient:
             username: Nextcloud username
             password: Nextcloud password
             directories: List of directories to scan for images
+            max_connections: Maximum number of requests to Nextcloud at the same time
+            max_bytes_per_second: Bandwidth cap for prefetching and scans (0 for no cap)
+            max_requests_per_second: Request rate cap for prefetching and scans (0 for no cap)
         """
         self.url = url.rstrip('/')
         self.username = username
         self.password = password
         self.directories = directories or ["Pictures"]
-        self.client = Client(
-            base_url=self.url,
-            auth=(self.username, self.password)
-        )
+        self._client = None
+        self._client_lock = threading.Lock()
         self._cached_images = {}
+        # Fail fast while Nextcloud is unreachable instead of waiting for timeouts
+        self.circuit_breaker = CircuitBreaker("Nextcloud", ignore_exceptions=(PreviewNotAvailableError,))
+        # Interactive requests go first, prefetching and scans share what is left
+        self.scheduler = FetchScheduler(max_connections, max_bytes_per_second, max_requests_per_second)
+
+    @property
+    def client(self):
+        """
+        WebDAV client, created on first use so importing webdav4 and httpx doesn't delay startup.
 
-    def list_pictures(self, folder: str = None) -> List[Dict]:
+        Returns:
+            webdav4 Client
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from webdav4.client import Client, ResourceNotFound
+                    # Missing files don't mean Nextcloud is unavailable
+                    self.circuit_breaker.ignore_exceptions = (ResourceNotFound, PreviewNotAvailableError)
+                    self._client = Client(
+                        base_url=self.url,
+                        auth=(self.username, self.password)
+                    )
+        return self._client
+
+    def list_pictures(self, folder: str = None, use_cache: bool = True) -> List[Dict]:
         """
         List all pictures in the specified folder.
 
         Args:
             folder: Specific folder to list (if None, lists all configured folders)
+            use_cache: Return the last listing of a specific folder instead of listing it again
 
         Returns:
             List of dictionaries containing image information
         """
         try:
             # If a specific folder is requested, check cache first
-            if folder and folder in self._cached_images:
+            if folder and use_cache and folder in self._cached_images:
                 logger.debug(f"Using cached images for folder: {folder}")
                 return self._cached_images[folder]
 
@@ -54,7 +123,8 @@ class NextcloudClient:
 
                 logger.info(f"Listing files in folder: {current_folder}")
                 # Use the correct method for listing files
-                files = self.client.ls(folder_path)
+                with self.scheduler.slot():
+                    files = self.circuit_breaker.call(self.client.ls, folder_path)
 
                 # Filter for image files
                 images = [
@@ -63,10 +133,12 @@ class NextcloudClient:
                         "path": file["href"],
                         "size": file.get("content_length", 0),
                         "modified": file.get("modified", ""),
-                        "content_type": file.get("content_type", "")
+                        "content_type": file.get("content_type", ""),
+                        "etag": file.get("etag") or "",
+                        "folder": current_folder
                     }
                     for file in files
-                    if file.get("type") == "file" and file["name"].lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp'))
+                    if file.get("type") == "file" and file["name"].lower().endswith(IMAGE_EXTENSIONS)
                 ]
 
                 logger.info(f"Found {len(images)} images in {current_folder}")
@@ -77,17 +149,22 @@ class NextcloudClient:
 
             return all_images
 
+        except CircuitOpenError as e:
+            logger.warning(f"Not listing pictures: {e}")
+            raise
         except Exception as e:
             traceback.print_exc()
             logger.error(f"Error listing pictures: {str(e)}")
             raise
 
-    def get_image(self, path: str) -> bytes:
+    def get_image(self, path: str, max_bytes: Optional[int] = None, offset: int = 0) -> bytes:
         """
         Get the content of an image file.
 
         Args:
             path: Full path to the image file
+            max_bytes: Only read the first max_bytes bytes (e.g. to parse the header)
+            offset: Start reading at this position (fetched with a range request)
 
         Returns:
             Image data as bytes
@@ -97,9 +174,74 @@ class NextcloudClient:
             # Decode the URL-encoded path
             decoded_path = unquote(path)
 
-            # Use open() for fetching files with the decoded path
-            with self.client.open(decoded_path, mode="rb") as f:
-                return f.read()
+            def read_image(transfer) -> bytes:
+                # Use open() for fetching files with the decoded path
+                with self.client.open(decoded_path, mode="rb") as f:
+                    if offset:
+                        f.seek(offset)
+                    # The response is streamed, so a partial read stops the download
+                    chunks = []
+                    remaining = max_bytes
+                    while remaining is None or remaining > 0:
+                        chunk = f.read(min(CHUNK_SIZE, remaining) if remaining else CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        chunks.append(chunk)
+                        transfer.add_bytes(len(chunk))
+                        if remaining:
+                            remaining -= len(chunk)
+                    return b"".join(chunks)
+
+            with self.scheduler.slot() as transfer:
+                return self.circuit_breaker.call(read_image, transfer)
+        except CircuitOpenError as e:
+            logger.warning(f"Not fetching image {path}: {e}")
+            raise
         except Exception as e:
             logger.error(f"Error fetching image {path}: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    def get_preview(self, path: str, max_size: int) -> bytes:
+        """
+        Get a preview of an image rendered by Nextcloud.
+        Nextcloud caches its previews, so this is much cheaper than decoding formats
+        like HEIC locally, as long as a preview provider for the format is enabled.
+
+        Args:
+            path: Full path to the image file
+            max_size: Maximum width/height of the preview
+
+        Returns:
+            Preview image data as bytes (JPG, already rotated)
+
+        Raises:
+            PreviewNotAvailableError: If Nextcloud can't render a preview of the file
+        """
+        try:
+            logger.debug(f"Fetching preview: {path}")
+            # The preview endpoint expects the path relative to the user's files
+            file_path = unquote(path).split(f"/remote.php/dav/files/{self.username}", 1)[-1]
+
+            def read_preview() -> bytes:
+                response = self.client.http.get(
+                    f"{self.url}/index.php/core/preview.png",
+                    params={"file": file_path, "x": max_size, "y": max_size, "a": 1, "forceIcon": 0}
+                )
+                if response.status_code in (403, 404, 501):
+                    raise PreviewNotAvailableError(f"No preview available for {file_path} ({response.status_code})")
+                response.raise_for_status()
+                return response.content
+
+            with self.scheduler.slot() as transfer:
+                preview = self.circuit_breaker.call(read_preview)
+                transfer.add_bytes(len(preview))
+                return preview
+        except CircuitOpenError as e:
+            logger.warning(f"Not fetching preview {path}: {e}")
+            raise
+        except PreviewNotAvailableError as e:
+            logger.debug(str(e))
+            raise
+        except Exception as e:
+            logger.error(f"Error fetching preview {path}: {str(e)}")
+            raise
@@ -0,0 +1,100 @@
+from collections import Counter
+from typing import Dict, List
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class ProfilerBusyError(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+class SamplingProfiler:
+    """
+    Low-overhead sampling profiler for the running process.
+    Periodically captures the stacks of all threads (event loop and worker threads)
+    and aggregates them into the collapsed stack format used by flamegraph tools.
+    """
+    def __init__(self, max_seconds: int = 60):
+        """
+        Initialize the profiler.
+
+        Args:
+            max_seconds: Upper limit for the duration of a single profile
+        """
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _format_frame(frame) -> str:
+        """
+        Format a single stack frame as "file.py:function".
+
+        Args:
+            frame: Python frame object
+
+        Returns:
+            Frame label
+        """
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+    def _collect_stack(self, frame) -> List[str]:
+        """
+        Collect the labels of a stack from the outermost to the innermost frame.
+
+        Args:
+            frame: Innermost frame of the stack
+
+        Returns:
+            List of frame labels
+        """
+        stack = []
+        while frame is not None:
+            stack.append(self._format_frame(frame))
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def sample(self, seconds: float, interval: float = 0.01) -> str:
+        """
+        Sample the stacks of all threads for the given duration.
+        Blocks the calling thread, so it should be run outside the event loop.
+
+        Args:
+            seconds: Duration of the profile in seconds
+            interval: Time between two samples in seconds
+
+        Returns:
+            Collapsed stacks, one "thread;frame;frame count" line per unique stack
+
+        Raises:
+            ProfilerBusyError: If another profile is currently running
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("A profile is already running")
+        try:
+            seconds = max(0.1, min(seconds, self.max_seconds))
+            own_thread = threading.get_ident()
+            counts: Counter = Counter()
+            samples = 0
+            deadline = time.monotonic() + seconds
+            logger.info(f"Starting sampling profile for {seconds}s (interval {interval * 1000:.0f}ms)")
+
+            while time.monotonic() < deadline:
+                thread_names: Dict[int, str] = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    thread_name = thread_names.get(thread_id, f"thread-{thread_id}").replace(" ", "_")
+                    stack = [thread_name] + self._collect_stack(frame)
+                    counts[";".join(stack)] += 1
+                samples += 1
+                time.sleep(interval)
+
+            logger.info(f"Finished sampling profile with {samples} samples and {len(counts)} unique stacks")
+            return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+        finally:
+            self._lock.release()
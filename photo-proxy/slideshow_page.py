@@ -1,5 +1,19 @@
-def generate_slideshow_page() -> str:
-    """Generate a slideshow page that displays random images."""
+def generate_slideshow_page(interval: float = 10) -> str:
+    """
+    Generate a slideshow page that displays random images.
+    The page joins a room over server-sent events and shows the slides announced there,
+    so all displays in the room change at the same time. Without server-sent events it
+    falls back to loading /random every interval.
+
+    Images are requested at the size of the screen in device pixels and are decoded
+    before they are shown.
+
+    Args:
+        interval: Default number of seconds each image is shown
+
+    Returns:
+        HTML page
+    """
     return """
     <!DOCTYPE html>
     <html>
@@ -87,23 +101,42 @@ def generate_slideshow_page() -> str:
     <body>
         <div class="slideshow-container">
             <div class="slide active">
-                <img src="/random" alt="Slideshow">
+                <img alt="Slideshow">
             </div>
             <div class="slide">
-                <img src="/random" alt="Slideshow">
+                <img alt="Slideshow">
             </div>
         </div>
         <div id="controls">
             <button onclick="toggleSlideshow()">Pause</button>
             <button onclick="nextImage()">Next</button>
-            <span id="status">Next image in: 10s</span>
+            <span id="status"></span>
         </div>
-
+    """ + f"""
+        <script>
+            const DEFAULT_INTERVAL = {interval};
+        </script>
+    """ + """
         <script>
+            // Room and display parameters are taken from the page URL, e.g. /slideshow?room=kitchen&aspect=16:9
+            const params = new URLSearchParams(window.location.search);
+            if (!params.has('size')) {
+                // Request images as large as the screen in device pixels, rounded so similar screens share cache entries
+                const pixels = Math.max(window.innerWidth, window.innerHeight) * (window.devicePixelRatio || 1);
+                params.set('size', Math.ceil(pixels / 128) * 128);
+            }
+            const LOOKAHEAD = 2;  // Decoded images kept ready when not following a room
+            const MAX_BUFFERED = 5;  // Announced slides loaded ahead at most
+            let interval = parseFloat(params.get('interval')) || DEFAULT_INTERVAL;
             let isPlaying = true;
+            let pushMode = false;
             let timer = null;
             let imageTimer = null;
-            let timeLeft = 10;
+            let clockOffset = 0;  // Server time minus local time in milliseconds
+            let nextChange = null;  // Server time of the next image change in milliseconds
+            let lastShownSlot = -1;
+            const buffer = new Map();  // Slot of announced slides to their loading image
+            const pollBuffer = [];  // Loading /random images
             let currentSlide = 0;
             let nextSlide = 1;
             const slides = document.querySelectorAll('.slide');
@@ -111,58 +144,144 @@ def generate_slideshow_page() -> str:
             const playButton = document.querySelector('button');
             const controls = document.getElementById('controls');
 
+            function serverNow() {
+                return Date.now() + clockOffset;
+            }
+
             function updateTimer() {
-                if (isPlaying) {
-                    timeLeft--;
+                if (isPlaying && nextChange !== null) {
+                    const timeLeft = Math.max(0, Math.round((nextChange - serverNow()) / 1000));
                     status.textContent = `Next image in: ${timeLeft}s`;
                 }
             }
 
-            function preloadImage(url) {
-                return new Promise((resolve, reject) => {
-                    const img = new Image();
-                    img.onload = () => resolve(img);
+            function loadImage(url) {
+                // Load and decode the image, so swapping it in doesn't stall the fade
+                const start = performance.now();
+                const img = new Image();
+                img.alt = 'Slideshow';
+                img.src = url;
+                const decoded = img.decode ? img.decode() : new Promise((resolve, reject) => {
+                    img.onload = resolve;
                     img.onerror = reject;
-                    img.src = url;
                 });
+                return decoded.then(() => ({ img, loadMs: performance.now() - start }));
             }
 
-            async function nextImage() {
-                try {
-                    // Preload the next image
-                    const nextImageUrl = '/random?' + new Date().getTime();
-                    await preloadImage(nextImageUrl);
+            function showImage(img) {
+                // Put the decoded image into the next slide
+                slides[nextSlide].replaceChildren(img);
 
-                    // Update the next slide's image
-                    slides[nextSlide].querySelector('img').src = nextImageUrl;
+                // Fade out current slide
+                slides[currentSlide].classList.remove('active');
 
-                    // Fade out current slide
-                    slides[currentSlide].classList.remove('active');
+                // Fade in next slide
+                slides[nextSlide].classList.add('active');
 
-                    // Fade in next slide
-                    slides[nextSlide].classList.add('active');
+                // Update slide indices
+                currentSlide = nextSlide;
+                nextSlide = (nextSlide + 1) % slides.length;
+            }
 
-                    // Update slide indices
-                    currentSlide = nextSlide;
-                    nextSlide = (nextSlide + 1) % slides.length;
+            function reportLoadTime(loadMs) {
+                // Lets the server announce slides early enough for this display
+                const query = new URLSearchParams(params);
+                query.set('load_ms', Math.round(loadMs));
+                const url = '/events/report?' + query.toString();
+                if (navigator.sendBeacon) {
+                    navigator.sendBeacon(url);
+                } else {
+                    fetch(url, { method: 'POST', keepalive: true });
+                }
+            }
 
-                    timeLeft = 10;
-                    status.textContent = `Next image in: ${timeLeft}s`;
+            function fillBuffer() {
+                while (pollBuffer.length < LOOKAHEAD) {
+                    pollBuffer.push(loadImage('/random?' + params.toString() + '&t=' + new Date().getTime()));
+                }
+            }
+
+            async function nextImage() {
+                fillBuffer();
+                const loading = pollBuffer.shift();
+                fillBuffer();
+                try {
+                    const { img } = await loading;
+                    showImage(img);
+                    if (!pushMode) {
+                        nextChange = serverNow() + interval * 1000;
+                        updateTimer();
+                    }
                 } catch (error) {
                     console.error('Error loading image:', error);
-                    // Try again immediately
-                    setTimeout(nextImage, 100);
+                    // Try again shortly
+                    setTimeout(nextImage, 1000);
                 }
             }
 
+            function scheduleSlide(slide) {
+                // Announced ahead of time: load the image now and show it at the announced time
+                clockOffset = slide.server_time * 1000 - Date.now();
+                interval = slide.interval;
+                if (buffer.has(slide.slot) || slide.slot <= lastShownSlot) {
+                    return;
+                }
+                const loading = loadImage(slide.url);
+                buffer.set(slide.slot, loading);
+                while (buffer.size > MAX_BUFFERED) {
+                    buffer.delete(buffer.keys().next().value);
+                }
+                loading
+                    .then(({ loadMs }) => reportLoadTime(loadMs))
+                    .catch((error) => console.error('Error loading image:', error));
+
+                setTimeout(async () => {
+                    try {
+                        const { img } = await loading;
+                        // Skip the slide if a newer one was shown while it was still loading
+                        if (isPlaying && slide.slot > lastShownSlot) {
+                            showImage(img);
+                            lastShownSlot = slide.slot;
+                        }
+                    } catch (error) {
+                        // Already logged, keep the current image
+                    } finally {
+                        buffer.delete(slide.slot);
+                    }
+                    nextChange = (slide.show_at + slide.interval) * 1000;
+                    updateTimer();
+                }, Math.max(0, slide.show_at * 1000 - serverNow()));
+            }
+
+            function startPolling() {
+                pushMode = false;
+                clearInterval(imageTimer);
+                imageTimer = setInterval(nextImage, interval * 1000);
+                nextImage();
+            }
+
+            function joinRoom() {
+                const source = new EventSource('/events?' + params.toString());
+                pushMode = true;
+                source.addEventListener('slide', (e) => scheduleSlide(JSON.parse(e.data)));
+                source.onerror = () => {
+                    // The browser reconnects by itself unless the server refused the stream
+                    if (source.readyState === EventSource.CLOSED) {
+                        startPolling();
+                    }
+                };
+            }
+
             function toggleSlideshow() {
                 isPlaying = !isPlaying;
                 playButton.textContent = isPlaying ? 'Pause' : 'Play';
+                if (pushMode) {
+                    return;
+                }
                 if (isPlaying) {
-                    timer = setInterval(updateTimer, 1000);
-                    imageTimer = setInterval(nextImage, 10000);
+                    imageTimer = setInterval(nextImage, interval * 1000);
+                    nextChange = serverNow() + interval * 1000;
                 } else {
-                    clearInterval(timer);
                     clearInterval(imageTimer);
                 }
             }
@@ -193,16 +312,12 @@ def generate_slideshow_page() -> str:
 
             // Start the slideshow
             timer = setInterval(updateTimer, 1000);
-            imageTimer = setInterval(nextImage, 10000);
-
-            // Handle image loading errors
-            document.querySelectorAll('.slide img').forEach(img => {
-                img.onerror = function() {
-                    console.error('Error loading image');
-                    nextImage();
-                };
-            });
+            if (window.EventSource) {
+                joinRoom();
+            } else {
+                startPolling();
+            }
         </script>
     </body>
     </html>
-    """
\ No newline at end of file
+    """
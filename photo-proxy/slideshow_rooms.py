@@ -0,0 +1,276 @@
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+import asyncio
+import json
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+class SlideshowRoom:
+    """
+    Displays that show the same slides at the same time.
+    The displays may have different resolutions: each gets the slides at its own size.
+    """
+    # Number of load times reported by the displays that are kept per room
+    LOAD_TIME_SAMPLES = 20
+
+    def __init__(self, key: str, params: Dict, interval: float):
+        """
+        Initialize the room.
+
+        Args:
+            key: Unique key of the room (name and the parameters selecting the slides)
+            params: Display parameters shared by all displays in the room (aspect, pair)
+            interval: Seconds each slide is shown
+        """
+        self.key = key
+        self.params = params
+        self.interval = interval
+        # Event queue of each display with the image size it requested
+        self.subscribers: Dict[asyncio.Queue, Optional[int]] = {}
+        self.announced: List[Dict] = []
+        self.load_times: Deque[float] = deque(maxlen=self.LOAD_TIME_SAMPLES)
+        self.task: Optional[asyncio.Task] = None
+
+    def prune(self) -> List[Dict]:
+        """
+        Drop the slides that have been replaced by a newer one.
+
+        Returns:
+            The current slide (if any) followed by the upcoming slides
+        """
+        now = time.time()
+        shown = [slide for slide in self.announced if slide["show_at"] <= now]
+        if len(shown) > 1:
+            self.announced = self.announced[len(shown) - 1:]
+        return self.announced
+
+class SlideshowScheduler:
+    """
+    Announces the slides of each room ahead of time over server-sent events.
+    Slides change on a fixed time grid (slot = time / interval). The slide of a slot is
+    chosen with a random generator seeded with the room and the slot, so every worker
+    process announces the same slide for the same slot without sharing any state.
+    Each slide is rendered once per image size in the room before it is announced,
+    so all displays load it from the cache.
+    Slides are announced early enough for the displays to load them: the lead time grows
+    with the load times the displays report, up to max_lookahead slides ahead.
+    """
+    # Seconds between keep-alive comments, so proxies don't close idle connections
+    KEEPALIVE_INTERVAL = 15
+
+    def __init__(
+        self,
+        select_slide: Callable[[Dict, random.Random], Awaitable[Dict]],
+        prepare_slide: Callable[[Dict, Optional[int]], Awaitable[None]],
+        get_slide_url: Callable[[Dict, Optional[int]], str],
+        interval: float = 10,
+        lead_time: float = 5,
+        max_lookahead: int = 3
+    ):
+        """
+        Initialize the scheduler.
+
+        Args:
+            select_slide: Coroutine choosing the slide for the room parameters with the given random generator,
+                returns a dictionary with at least the "path" of the slide
+            prepare_slide: Coroutine rendering the slide into the cache at the given image size
+            get_slide_url: Function returning the URL of the slide at the given image size
+            interval: Default number of seconds each slide is shown
+            lead_time: Minimum number of seconds a slide is announced before it is shown
+            max_lookahead: Maximum number of slides announced ahead
+        """
+        self.select_slide = select_slide
+        self.prepare_slide = prepare_slide
+        self.get_slide_url = get_slide_url
+        self.interval = interval
+        self.lead_time = lead_time
+        self.max_lookahead = max_lookahead
+        self.rooms: Dict[str, SlideshowRoom] = {}
+
+    def get_room_key(self, name: str, params: Dict, interval: Optional[float] = None) -> str:
+        """
+        Get the key of a room. Displays with parameters that select different slides get their own room,
+        the image size of a display doesn't matter.
+
+        Args:
+            name: Name of the room
+            params: Display parameters of the room (aspect, pair)
+            interval: Seconds each slide is shown (None for the default interval)
+
+        Returns:
+            Room key
+        """
+        params = {**params, "interval": interval or self.interval}
+        return f"{name}|" + "|".join(f"{k}={v}" for k, v in sorted(params.items()) if v is not None)
+
+    def get_lead_time(self, room: SlideshowRoom) -> float:
+        """
+        Get how many seconds ahead the slides of a room are announced.
+        Twice the slowest of the recent load times (ignoring the slowest 10%), at least lead_time.
+
+        Args:
+            room: Room to get the lead time for
+
+        Returns:
+            Lead time in seconds
+        """
+        lead_time = self.lead_time
+        if room.load_times:
+            load_times = sorted(room.load_times)
+            lead_time = max(lead_time, 2 * load_times[int(len(load_times) * 0.9)])
+        return min(lead_time, room.interval * self.max_lookahead)
+
+    def record_load_time(self, name: str, params: Dict, interval: Optional[float], load_time: float) -> None:
+        """
+        Record how long a display took to load and decode a slide.
+
+        Args:
+            name: Name of the room
+            params: Display parameters of the room
+            interval: Seconds each slide is shown (None for the default interval)
+            load_time: Load time in seconds
+        """
+        room = self.rooms.get(self.get_room_key(name, params, interval))
+        if room:
+            room.load_times.append(load_time)
+
+    @staticmethod
+    def format_event(event: str, data: Dict) -> str:
+        """
+        Format a server-sent event.
+
+        Args:
+            event: Event type
+            data: Event data, sent as JSON
+
+        Returns:
+            Event in the text/event-stream format
+        """
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def _broadcast(self, room: SlideshowRoom, slide: Dict) -> None:
+        """
+        Announce a slide to all displays in a room, at the image size of each display.
+
+        Args:
+            room: Room to send the event to
+            slide: Slide to announce
+        """
+        events: Dict[Optional[int], str] = {}
+        for queue, size in room.subscribers.items():
+            if size not in events:
+                events[size] = self._slide_event(slide, size)
+            queue.put_nowait(events[size])
+
+    def _slide_event(self, slide: Dict, size: Optional[int]) -> str:
+        """
+        Format the announcement of a slide, with the server time so displays can correct their clock.
+
+        Args:
+            slide: Slide to announce
+            size: Image size requested by the display
+
+        Returns:
+            Formatted event
+        """
+        return self.format_event(
+            "slide", {**slide, "url": self.get_slide_url(slide, size), "size": size, "server_time": time.time()}
+        )
+
+    async def _run(self, room: SlideshowRoom) -> None:
+        """
+        Announce the slides of a room until the last display leaves.
+
+        Args:
+            room: Room to run
+        """
+        # The first display of a room gets the slide of the running slot right away
+        next_slot = int(time.time() // room.interval)
+        while room.subscribers:
+            show_at = next_slot * room.interval
+            await asyncio.sleep(max(0.0, show_at - self.get_lead_time(room) - time.time()))
+            if not room.subscribers:
+                break
+            if show_at + room.interval <= time.time():
+                # Fell behind, e.g. while Nextcloud was unavailable
+                next_slot = int(time.time() // room.interval)
+                continue
+
+            try:
+                slide = await self.select_slide(room.params, random.Random(f"{room.key}:{next_slot}"))
+                sizes = set(room.subscribers.values())
+                await asyncio.gather(*(self.prepare_slide(slide, size) for size in sizes))
+            except Exception as e:
+                logger.warning(f"Skipping slide {next_slot} of room {room.key}: {e}")
+                next_slot += 1
+                await asyncio.sleep(1)
+                continue
+
+            slide = {**slide, "slot": next_slot, "show_at": show_at, "interval": room.interval}
+            room.prune()
+            room.announced.append(slide)
+            self._broadcast(room, slide)
+            logger.debug(f"Announced slide {next_slot} of room {room.key}: {slide['path']}")
+            next_slot += 1
+
+    async def subscribe(
+        self,
+        name: str,
+        params: Dict,
+        interval: Optional[float] = None,
+        size: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """
+        Join a room and receive its slide announcements as server-sent events.
+        A new display gets the current and the upcoming slides right away.
+
+        Args:
+            name: Name of the room
+            params: Display parameters of the room (aspect, pair)
+            interval: Seconds each slide is shown (None for the default interval)
+            size: Image size of the display (None for max_image_size)
+
+        Returns:
+            Iterator of formatted events
+        """
+        interval = interval or self.interval
+        key = self.get_room_key(name, params, interval)
+        room = self.rooms.get(key)
+        if room is None:
+            room = self.rooms[key] = SlideshowRoom(key, params, interval)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        room.subscribers[queue] = size
+        logger.info(f"Display joined room {key} ({len(room.subscribers)} displays)")
+        if room.task is None or room.task.done():
+            room.task = asyncio.create_task(self._run(room))
+        try:
+            for slide in room.prune():
+                yield self._slide_event(slide, size)
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=self.KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            room.subscribers.pop(queue, None)
+            logger.info(f"Display left room {key} ({len(room.subscribers)} displays)")
+            if not room.subscribers:
+                if room.task:
+                    room.task.cancel()
+                self.rooms.pop(key, None)
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """
+        Get the number of displays and the lead time per room.
+
+        Returns:
+            Dictionary of room key to room statistics
+        """
+        return {
+            key: {"displays": len(room.subscribers), "lead_time": round(self.get_lead_time(room), 1)}
+            for key, room in self.rooms.items()
+        }
@@ -1,7 +1,70 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
+from datetime import datetime
+from html import escape
 
-def generate_status_page(images: List[Dict], nextcloud_url: str, nextcloud_username: str, nextcloud_dirs: List[str], max_image_size: int, jpg_quality: int, convert_to_jpg: bool, crop_portrait_to_square: bool, cache_stats: Dict[str, int], debug_logging: bool) -> str:
+def format_bytes(size: int) -> str:
+    """Format a number of bytes in a human readable unit."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+def generate_folder_rows(folders: Dict[str, Dict[str, int]]) -> str:
+    """Generate the table rows with image counts and sizes per folder."""
+    if not folders:
+        return """
+                                    <tr>
+                                        <td colspan="3" class="text-muted">No images indexed yet</td>
+                                    </tr>"""
+    return "".join(f"""
+                                    <tr>
+                                        <td class="text-break">{escape(folder)}</td>
+                                        <td>{stats["count"]}</td>
+                                        <td>{format_bytes(stats["bytes"])}</td>
+                                    </tr>""" for folder, stats in folders.items())
+
+def generate_slow_requests_rows(slow_requests: List[Dict]) -> str:
+    """Generate the table rows for the slowest recorded image requests."""
+    if not slow_requests:
+        return """
+                                    <tr>
+                                        <td colspan="4" class="text-muted">No requests recorded yet</td>
+                                    </tr>"""
+    rows = []
+    for entry in slow_requests:
+        started_at = datetime.fromtimestamp(entry["started_at"]).strftime("%Y-%m-%d %H:%M:%S")
+        stages = ", ".join(f"{name} {duration:.1f} ms" for name, duration in entry["stages"].items())
+        rows.append(f"""
+                                    <tr>
+                                        <td class="text-nowrap">{started_at}</td>
+                                        <td class="text-break">{escape(entry["name"])}</td>
+                                        <td class="text-nowrap">{entry["total_ms"]:.1f} ms</td>
+                                        <td class="small">{escape(stages)}</td>
+                                    </tr>""")
+    return "".join(rows)
+
+def generate_fetch_rows(fetch_stats: Dict[str, Dict]) -> str:
+    """Generate the table rows with latency and throughput of the Nextcloud requests per priority class."""
+    return "".join(f"""
+                                    <tr>
+                                        <td>{escape(priority.capitalize())}</td>
+                                        <td>{stats["requests"]} ({stats["active"]} active, {stats["queued"]} queued)</td>
+                                        <td class="text-nowrap">{stats["avg_wait_ms"]:.1f} / {stats["max_wait_ms"]:.1f} ms</td>
+                                        <td class="text-nowrap">{stats["avg_time_ms"]:.1f} ms</td>
+                                        <td class="text-nowrap">{format_bytes(stats["bytes"])} ({stats["throughput_kbps"]:.1f} KB/s)</td>
+                                    </tr>""" for priority, stats in fetch_stats.items())
+
+def generate_status_page(library_summary: Dict, nextcloud_url: str, nextcloud_username: str, nextcloud_dirs: List[str], max_image_size: int, allow_upscale: bool, jpg_quality: int, convert_to_jpg: bool, crop_portrait_to_square: bool, cache_stats: Dict[str, int], disk_cache_stats: Optional[Dict[str, float]], worker_info: Dict[str, int], admission_stats: Dict[str, int], health: Dict, debug_logging: bool, slow_requests: Optional[List[Dict]] = None, fetch_stats: Optional[Dict[str, Dict]] = None) -> str:
     """Generate a status page with information about the service using Bootstrap 5."""
+    last_sync = library_summary.get("last_sync")
+    last_sync_text = datetime.fromtimestamp(last_sync).strftime("%Y-%m-%d %H:%M:%S") if last_sync else "Never"
+    degraded = health["status"] == "degraded"
+    degraded_reason = health["nextcloud"]["last_error"] or health["index"]["last_error"] or ""
+    degraded_alert = f"""<div class="alert alert-warning">
+                                <i class="bi bi-exclamation-triangle-fill me-2"></i>
+                                Nextcloud is unavailable, serving the last known library and cached images. {escape(degraded_reason)}
+                            </div>""" if degraded else ""
     return f"""
     <!DOCTYPE html>
     <html>
@@ -69,17 +132,18 @@ def generate_status_page(images: List[Dict], nextcloud_url: str, nextcloud_usern
                             <h2 class="h5 mb-0">Service Status</h2>
                         </div>
                         <div class="card-body">
+                            {degraded_alert}
                             <div class="row">
                                 <div class="col-md-3">
                                     <div class="d-flex align-items-center mb-3">
-                                        <i class="bi bi-check-circle-fill text-success me-2"></i>
-                                        <span class="status-badge">Running</span>
+                                        <i class="bi {'bi-exclamation-triangle-fill text-warning' if degraded else 'bi-check-circle-fill text-success'} me-2"></i>
+                                        <span class="status-badge">{'Degraded' if degraded else 'Running'}</span>
                                     </div>
                                 </div>
                                 <div class="col-md-3">
                                     <div class="d-flex align-items-center mb-3">
                                         <i class="bi bi-images me-2"></i>
-                                        <span class="status-badge">Total Images: {len(images)}</span>
+                                        <span class="status-badge">Total Images: {library_summary['total_images']}</span>
                                     </div>
                                 </div>
                                 <div class="col-md-3">
@@ -110,12 +174,126 @@ def generate_status_page(images: List[Dict], nextcloud_url: str, nextcloud_usern
                                 </div>
                             </div>
                             <div class="row">
-                                <div class="col-12">
-                                    <div class="d-flex align-items-center">
+                                <div class="col-md-6">
+                                    <div class="d-flex align-items-center mb-3">
                                         <i class="bi bi-graph-up me-2"></i>
                                         <span class="status-badge">Cache Hit Ratio: {cache_stats['hit_ratio']}%</span>
                                     </div>
                                 </div>
+                                <div class="col-md-6">
+                                    <div class="d-flex align-items-center mb-3">
+                                        <i class="bi bi-cpu me-2"></i>
+                                        <span class="status-badge">Processing: {admission_stats['active']}/{admission_stats['max_concurrent']} ({admission_stats['waiting']} waiting)</span>
+                                    </div>
+                                </div>
+                            </div>
+                            <div class="row">
+                                <div class="col-md-6">
+                                    <div class="d-flex align-items-center mb-3">
+                                        <i class="bi bi-slash-circle me-2"></i>
+                                        <span class="status-badge">Rejected Under Load: {admission_stats['rejected']}</span>
+                                    </div>
+                                </div>
+                                <div class="col-md-6">
+                                    <div class="d-flex align-items-center mb-3">
+                                        <i class="bi bi-device-hdd me-2"></i>
+                                        <span class="status-badge">Disk Cache: {f"{disk_cache_stats['size']} images ({disk_cache_stats['size_mb']}/{disk_cache_stats['max_size_mb']} MB)" if disk_cache_stats else 'Disabled'}</span>
+                                    </div>
+                                </div>
+                            </div>
+                            <div class="row">
+                                <div class="col-12">
+                                    <div class="d-flex align-items-center">
+                                        <i class="bi bi-diagram-3 me-2"></i>
+                                        <span class="status-badge">Worker: PID {worker_info['pid']} of {worker_info['workers']} (memory cache and request statistics are per worker)</span>
+                                    </div>
+                                </div>
+                            </div>
+                        </div>
+                    </div>
+
+                    <div class="card">
+                        <div class="card-header bg-secondary text-white">
+                            <h2 class="h5 mb-0">Library</h2>
+                        </div>
+                        <div class="card-body">
+                            <div class="row">
+                                <div class="col-md-4">
+                                    <div class="d-flex align-items-center mb-3">
+                                        <i class="bi bi-images me-2"></i>
+                                        <span class="status-badge">Images: {library_summary['total_images']}{f" ({library_summary['duplicates']} duplicates)" if library_summary.get('duplicates') else ""}</span>
+                                    </div>
+                                </div>
+                                <div class="col-md-4">
+                                    <div class="d-flex align-items-center mb-3">
+                                        <i class="bi bi-hdd-stack me-2"></i>
+                                        <span class="status-badge">Total Size: {format_bytes(library_summary['total_bytes'])}</span>
+                                    </div>
+                                </div>
+                                <div class="col-md-4">
+                                    <div class="d-flex align-items-center mb-3">
+                                        <i class="bi bi-arrow-repeat me-2"></i>
+                                        <span class="status-badge">Last Sync: {last_sync_text}</span>
+                                    </div>
+                                </div>
+                            </div>
+                            <div class="table-responsive">
+                                <table class="table table-sm mb-0">
+                                    <thead>
+                                        <tr>
+                                            <th>Folder</th>
+                                            <th>Images</th>
+                                            <th>Size</th>
+                                        </tr>
+                                    </thead>
+                                    <tbody>{generate_folder_rows(library_summary['folders'])}
+                                    </tbody>
+                                </table>
+                            </div>
+                        </div>
+                    </div>
+
+                    <div class="card">
+                        <div class="card-header bg-secondary text-white">
+                            <h2 class="h5 mb-0">Nextcloud Requests</h2>
+                        </div>
+                        <div class="card-body">
+                            <div class="table-responsive">
+                                <table class="table table-sm mb-0">
+                                    <thead>
+                                        <tr>
+                                            <th>Priority</th>
+                                            <th>Requests</th>
+                                            <th>Wait (avg / max)</th>
+                                            <th>Time (avg)</th>
+                                            <th>Received</th>
+                                        </tr>
+                                    </thead>
+                                    <tbody>{generate_fetch_rows(fetch_stats or {})}
+                                    </tbody>
+                                </table>
+                            </div>
+                        </div>
+                    </div>
+
+                    <div class="card">
+                        <div class="card-header bg-warning">
+                            <h2 class="h5 mb-0">Slowest Requests</h2>
+                        </div>
+                        <div class="card-body">
+                            <div class="table-responsive">
+                                <table class="table table-sm mb-0">
+                                    <thead>
+                                        <tr>
+                                            <th>Time</th>
+                                            <th>Image</th>
+                                            <th>Total</th>
+                                            <th>Stages</th>
+                                        </tr>
+                                    </thead>
+                                    <tbody>{generate_slow_requests_rows(slow_requests or [])}
+                                    </tbody>
+                                </table>
                             </div>
                         </div>
                     </div>
@@ -151,6 +329,11 @@ def generate_status_page(images: List[Dict], nextcloud_url: str, nextcloud_usern
                                         <div class="config-value">{max_image_size}px</div>
                                         <div class="config-description">Maximum width/height for scaling images</div>
                                     </div>
+                                    <div class="config-item">
+                                        <div class="config-label">Upscale Small Images</div>
+                                        <div class="config-value">{'Yes' if allow_upscale else 'No'}</div>
+                                        <div class="config-description">Enlarge images smaller than the maximum size</div>
+                                    </div>
                                     <div class="config-item">
                                         <div class="config-label">JPEG Quality</div>
                                         <div class="config-value">{jpg_quality}%</div>
@@ -214,6 +397,17 @@ def generate_status_page(images: List[Dict], nextcloud_url: str, nextcloud_usern
                                     </div>
                                 </a>
                             </div>
+                            <div class="endpoint">
+                                <a href="/api/images" target="_blank">
+                                    <div class="d-flex align-items-center">
+                                        <i class="bi bi-list-ul me-2"></i>
+                                        <div>
+                                            <strong>GET /api/images</strong>
+                                            <div class="text-muted small">Paginated list of indexed images (offset, limit, sort, order)</div>
+                                        </div>
+                                    </div>
+                                </a>
+                            </div>
                             <div class="endpoint">
                                 <a href="/health" target="_blank">
                                     <div class="d-flex align-items-center">
@@ -0,0 +1,159 @@
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Union
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class RequestTimer:
+    """
+    Collects the duration of the individual stages of a single request.
+    Stage durations are kept in milliseconds and rendered as a Server-Timing header.
+    """
+    def __init__(self, name: str):
+        """
+        Initialize the timer.
+
+        Args:
+            name: Label for the request (typically the image path)
+        """
+        self.name = name
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, stage_name: str) -> Iterator[None]:
+        """
+        Measure the duration of a stage. Repeated stages are accumulated.
+
+        Args:
+            stage_name: Name of the stage (e.g. "download", "decode")
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.stages[stage_name] = self.stages.get(stage_name, 0.0) + elapsed
+
+    def total_ms(self) -> float:
+        """
+        Get the time elapsed since the timer was created.
+
+        Returns:
+            Elapsed time in milliseconds
+        """
+        return (time.perf_counter() - self._start) * 1000
+
+    def server_timing_header(self) -> str:
+        """
+        Render the collected stages as a Server-Timing header value.
+
+        Returns:
+            Header value, e.g. "cache;dur=0.02, download;dur=412.3, total;dur=530.1"
+        """
+        metrics = [f"{name};dur={duration:.2f}" for name, duration in self.stages.items()]
+        metrics.append(f"total;dur={self.total_ms():.2f}")
+        return ", ".join(metrics)
+
+    def to_dict(self) -> Dict:
+        """
+        Get a summary of the timer for the slow request log.
+
+        Returns:
+            Dictionary with name, start time, total and per-stage durations
+        """
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "total_ms": round(self.total_ms(), 2),
+            "stages": {name: round(duration, 2) for name, duration in self.stages.items()}
+        }
+
+class NullTimer:
+    """
+    Timer that records nothing. Used when request timing is disabled so the
+    instrumented code paths only pay for a method call.
+    """
+    name = ""
+    stages: Dict[str, float] = {}
+    _context = nullcontext()
+
+    def stage(self, stage_name: str):
+        """Return a no-op context manager."""
+        return self._context
+
+    def total_ms(self) -> float:
+        """Return zero, nothing is measured."""
+        return 0.0
+
+    def server_timing_header(self) -> str:
+        """Return an empty header value."""
+        return ""
+
+NULL_TIMER = NullTimer()
+
+class SlowRequestLog:
+    """
+    Keeps the slowest N requests seen so far, including their stage timings.
+    Backed by a min-heap so recording a request is O(log N).
+    """
+    def __init__(self, max_entries: int = 20):
+        """
+        Initialize the log.
+
+        Args:
+            max_entries: Number of requests to keep (0 disables the log)
+        """
+        self.max_entries = max_entries
+        self._heap: List = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def record(self, timer: RequestTimer) -> None:
+        """
+        Record a finished request if it is among the slowest seen.
+
+        Args:
+            timer: Timer of the finished request
+        """
+        if self.max_entries <= 0 or isinstance(timer, NullTimer):
+            return
+        total = timer.total_ms()
+        with self._lock:
+            if len(self._heap) < self.max_entries:
+                heapq.heappush(self._heap, (total, next(self._counter), timer.to_dict()))
+            elif total > self._heap[0][0]:
+                heapq.heapreplace(self._heap, (total, next(self._counter), timer.to_dict()))
+
+    def get_entries(self) -> List[Dict]:
+        """
+        Get the recorded requests, slowest first.
+
+        Returns:
+            List of request summaries
+        """
+        with self._lock:
+            return [entry for _, _, entry in sorted(self._heap, key=lambda item: item[0], reverse=True)]
+
+    def clear(self) -> None:
+        """Clear the log."""
+        with self._lock:
+            self._heap.clear()
+
+def start_timer(name: str, enabled: bool) -> Union[RequestTimer, NullTimer]:
+    """
+    Create a timer for a request.
+
+    Args:
+        name: Label for the request
+        enabled: Whether timing is enabled
+
+    Returns:
+        A RequestTimer if enabled, otherwise the shared NullTimer
+    """
+    return RequestTimer(name) if enabled else NULL_TIMER